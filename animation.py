@@ -0,0 +1,133 @@
+"""Texture animation of every character in one pass
+
+A FrameTable lays out each character's textures once, so an animation
+state, frame and facing turn into a texture with one array index.
+AnimationSystem steps every animated entity together with NumPy, keeping
+the facing, frame and odometers in entity_store, and only assigns
+sprite.texture to the sprites whose frame changed. Assigning a texture
+resizes the sprite and updates every sprite list holding it, so on most
+steps most sprites are left alone.
+"""
+import numpy as np
+import constants as game
+from components import entity_store
+
+# Animation states
+IDLE, WALK, JUMP, FALL, CLIMB = range(5)
+STATE_COUNT = 5
+
+# Frames in the walk, the longest animation
+FRAME_COUNT = 8
+
+# Frames in the climb, which loops sooner
+CLIMB_FRAMES = 2
+
+
+class FrameTable:
+    """ Every character's animation frames, indexed by (character, state, frame, facing)
+
+    table holds indexes into textures. States with fewer frames repeat them
+    to fill FRAME_COUNT, and climbing frames are the same for both facings.
+    """
+    def __init__(self):
+        self.textures = []
+        self.characters = {}
+        self.table = np.zeros((0, STATE_COUNT, FRAME_COUNT, 2), dtype=np.int32)
+
+    def _add(self, texture):
+        self.textures.append(texture)
+        return len(self.textures) - 1
+
+    def character_id(self, character_textures):
+        """ The table index of a CharacterTextures, laying out its frames on first use """
+        character = self.characters.get(character_textures)
+        if character is not None:
+            return character
+
+        frames = np.zeros((1, STATE_COUNT, FRAME_COUNT, 2), dtype=np.int32)
+        for face in (game.RIGHT_FACING, game.LEFT_FACING):
+            frames[0, IDLE, :, face] = self._add(character_textures.idle_texture_pair[face])
+            frames[0, JUMP, :, face] = self._add(character_textures.jump_texture_pair[face])
+            frames[0, FALL, :, face] = self._add(character_textures.fall_texture_pair[face])
+            for frame, pair in enumerate(character_textures.walk_textures):
+                frames[0, WALK, frame, face] = self._add(pair[face])
+        climbing = [self._add(texture) for texture in character_textures.climbing_textures]
+        for frame in range(FRAME_COUNT):
+            frames[0, CLIMB, frame, :] = climbing[frame % len(climbing)]
+
+        character = len(self.table)
+        self.table = np.concatenate((self.table, frames))
+        self.characters[character_textures] = character
+        return character
+
+    def assign(self, row, character_textures):
+        """ Animate an entity_store row with a character, which starts out showing its first idle frame """
+        character = self.character_id(character_textures)
+        entity_store.character[row] = character
+        entity_store.shown[row] = self.table[character, IDLE, 0, game.RIGHT_FACING]
+
+
+# The frames of every character loaded so far
+frame_table = FrameTable()
+
+
+class AnimationSystem:
+    """ Picks the texture of every animated entity for a step
+
+    The rules are the same for every character: face the way it moved,
+    climb while on a ladder off the ground, jump or fall while in the air,
+    stand idle when not moving sideways, and otherwise walk. Climbing and
+    walking move on a frame every DISTANCE_TO_CHANGE_TEXTURE travelled.
+    """
+    def __init__(self, frame_table=frame_table):
+        self.frame_table = frame_table
+
+    def update(self, sprites, on_ground):
+        """ Step the animation of entities after they moved, given which of them stand on something """
+        if not sprites:
+            return
+        store = entity_store
+        on_ground = np.asarray(on_ground, dtype=bool)
+        rows = np.array([sprite.row for sprite in sprites], dtype=np.intp)
+        positions = np.array([sprite.position for sprite in sprites], dtype=float)
+
+        # Movement since the last step, none for entities not animated before
+        dx = np.nan_to_num(positions[:, 0] - store.last_x[rows])
+        dy = np.nan_to_num(positions[:, 1] - store.last_y[rows])
+        store.last_x[rows] = positions[:, 0]
+        store.last_y[rows] = positions[:, 1]
+
+        face = store.face[rows]
+        face = np.where(dx < -game.DEAD_ZONE, game.LEFT_FACING, np.where(dx > game.DEAD_ZONE, game.RIGHT_FACING, face))
+        x_odometer = store.x_odometer[rows] + dx
+        y_odometer = store.y_odometer[rows] + dy
+        frame = store.cur_texture[rows].astype(np.intp)
+
+        on_ladder = np.array([sprite.is_on_ladder for sprite in sprites], dtype=bool)
+        climbing = on_ladder & ~on_ground
+        airborne = ~climbing & ~on_ground
+        state = np.where(np.abs(dx) <= game.DEAD_ZONE, IDLE, WALK)
+        state[airborne & (dy < -game.DEAD_ZONE)] = FALL
+        state[airborne & (dy > game.DEAD_ZONE)] = JUMP
+        state[climbing] = CLIMB
+
+        # Move on a frame once far enough along, looping each animation
+        climb_step = climbing & (np.abs(y_odometer) > game.DISTANCE_TO_CHANGE_TEXTURE)
+        walk_step = (state == WALK) & (np.abs(x_odometer) > game.DISTANCE_TO_CHANGE_TEXTURE)
+        y_odometer[climb_step] = 0
+        x_odometer[walk_step] = 0
+        frame += climb_step | walk_step
+        frame[climbing & (frame >= CLIMB_FRAMES)] = 0
+        frame[frame >= FRAME_COUNT] = 0
+
+        store.face[rows] = face
+        store.x_odometer[rows] = x_odometer
+        store.y_odometer[rows] = y_odometer
+        store.cur_texture[rows] = frame
+
+        # Only sprites showing another frame get a texture set
+        shown = self.frame_table.table[store.character[rows], state, frame, face]
+        textures = self.frame_table.textures
+        for index in np.flatnonzero(shown != store.shown[rows]).tolist():
+            sprites[index].texture = textures[shown[index]]
+        store.shown[rows] = shown
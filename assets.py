@@ -0,0 +1,118 @@
+"""Loading game assets in the background
+
+The title screen starts an AssetLoader, which decodes the sounds, the
+character animations and the first level on a worker thread while the
+player reads the title and instructions screens. GameView then finds
+everything already loaded, so the first level appears as soon as the
+player presses Enter.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import arcade
+import constants as game
+import levels
+from entities import get_character_textures
+
+# Sound effects GameView plays
+JUMP_SOUND = ":resources:sounds/jump1.wav"
+GAME_OVER_SOUND = ":resources:sounds/gameover1.wav"
+
+# (name_folder, name_file) of every animated character
+CHARACTERS = [("male_person", "malePerson"), ("robot", "robot")]
+
+# Single textures used by gameplay sprites
+TEXTURES = [":resources:images/space_shooter/laserBlue01.png"]
+
+# Loaded sounds, keyed by path
+_sounds = {}
+
+
+def image_path(name):
+    """ Path of an image in assets/images, whatever the working directory """
+    return game.ASSETS_PATH / "images" / name
+
+
+def get_sound(path):
+    """ Return a sound, decoding it on first use """
+    sound = _sounds.get(path)
+    if sound is None:
+        sound = arcade.load_sound(path)
+        _sounds[path] = sound
+    return sound
+
+
+def warm_hit_boxes(textures):
+    """ Work out the hit box character sprites take from the idle frame, returning its points
+
+    arcade calculates a texture's hit box on first use, which would
+    otherwise be in the constructor of the first sprite to use it.
+    """
+    return textures.idle_texture_pair[0].hit_box_points
+
+
+def load_character(name_folder, name_file):
+    """ Load a character's animations and the hit box its sprites take from the idle frame """
+    textures = get_character_textures(name_folder, name_file)
+    warm_hit_boxes(textures)
+    return textures
+
+
+class AssetLoader:
+    """ Loads GameView's assets on a worker thread, reporting its progress
+
+    progress is polled by the title screens' loading bar. level_prefetcher
+    holds the first level once loaded, ready for GameView to take.
+    """
+    def __init__(self):
+        self.level_prefetcher = levels.LevelPrefetcher()
+
+        self.jobs = [(path, get_sound, path) for path in (JUMP_SOUND, GAME_OVER_SOUND)]
+        self.jobs += [("/".join(character), load_character, *character) for character in CHARACTERS]
+        self.jobs += [(path, arcade.load_texture, path) for path in TEXTURES]
+        self.total = len(self.jobs) + 1
+        self.loaded = 0
+        self._lock = threading.Lock()
+
+        # The level goes through the prefetcher, which has its own worker
+        map_path = levels.level_map_path(1)
+        self.level_prefetcher.prefetch(map_path, game.SPRITE_SCALING_TILES).add_done_callback(
+            lambda _future: self._loaded())
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="asset-loader")
+        self._executor.submit(self._load_all)
+        self._executor.shutdown(wait=False)
+
+    @property
+    def progress(self):
+        """ Fraction of the assets loaded, from 0 to 1 """
+        return self.loaded / self.total
+
+    @property
+    def done(self):
+        return self.loaded == self.total
+
+    def _load_all(self):
+        for name, load, *args in self.jobs:
+            try:
+                load(*args)
+            except Exception as e:
+                # GameView loads anything missing itself
+                logging.warning(f"Preloading {name} failed: {e}")
+            self._loaded()
+
+    def _loaded(self):
+        with self._lock:
+            self.loaded += 1
+
+
+# The loader started by the first title screen
+_loader = None
+
+
+def preload():
+    """ Start loading the game's assets in the background, once, returning the loader """
+    global _loader
+    if _loader is None:
+        _loader = AssetLoader()
+    return _loader
@@ -0,0 +1,558 @@
+"""Repeatable performance scenarios
+
+Every scenario is timed one iteration at a time and reported as p50/p95/p99
+milliseconds. The report also gives the time spent inside the methods most
+likely to regress (SUBSYSTEMS) and the memory allocated per iteration, which
+is measured in a separate tracemalloc pass. Results are written as JSON so
+two commits can be compared:
+
+    python benchmarks.py --output before.json
+    python benchmarks.py --output after.json --compare before.json
+
+Recorded play sessions can be added as scenarios with --replay.
+
+Scenarios that draw need an OpenGL window. Without a display pyglet's
+headless EGL mode is used, and if no window can be opened those scenarios
+are skipped.
+"""
+import argparse
+import json
+import math
+import os
+import pathlib
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import pyglet
+
+# Without a display the window has to come from pyglet's EGL headless mode
+if sys.platform.startswith("linux") and not os.environ.get("DISPLAY"):
+    pyglet.options["headless"] = True
+
+import arcade
+import constants as game
+import entities
+import levels
+from bullets import BulletPool
+from animation import AnimationSystem
+from enemies import EnemySystem
+from entities import RobotEnemy
+from replay import InputRecording
+from streaming import LevelStreamer
+from simulation import HeadlessRunner, ScriptedInput, run_right_script
+from views import GameOverView, GameView
+
+# Methods whose inclusive time is also reported on its own
+SUBSYSTEMS = {
+    "GameView.fixed_update": (GameView, "fixed_update"),
+    "GameView.on_draw": (GameView, "on_draw"),
+    "PymunkPhysicsEngine.step": (arcade.PymunkPhysicsEngine, "step"),
+    "Entity.pymunk_moved": (entities.Entity, "pymunk_moved"),
+    "EnemySystem.update": (EnemySystem, "update"),
+    "LevelStreamer.update": (LevelStreamer, "update"),
+    "AnimationSystem.update": (AnimationSystem, "update"),
+    "BulletPool.update": (BulletPool, "update"),
+}
+
+# Timings below this many milliseconds are too small to compare between runs
+MIN_COMPARED_MS = 0.05
+
+# Copies of level 1 side by side in the wide level, big enough to be streamed
+WIDE_LEVEL_COPIES = 20
+
+# Pixels the player is carried across the wide level per step, a fast run
+FLYOVER_SPEED = 20
+
+# Input of a whole game played through to the win, replayed by the playthrough scenario
+PLAYTHROUGH_RECORDING = game.ASSETS_PATH / "recordings" / "playthrough.json"
+
+
+class SubsystemTimer:
+    """ Adds up the time spent in each SUBSYSTEMS method while active """
+    def __init__(self):
+        self.totals = dict.fromkeys(SUBSYSTEMS, 0.0)
+        self._originals = {}
+
+    def __enter__(self):
+        for name, (owner, attribute) in SUBSYSTEMS.items():
+            original = owner.__dict__[attribute]
+            self._originals[name] = original
+            setattr(owner, attribute, self._timed(name, original))
+        return self
+
+    def __exit__(self, *exc_info):
+        for name, (owner, attribute) in SUBSYSTEMS.items():
+            setattr(owner, attribute, self._originals[name])
+
+    def _timed(self, name, method):
+        totals = self.totals
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                totals[name] += time.perf_counter() - start
+        return timed
+
+    def take(self):
+        """ Return the totals since the last call and start again from zero """
+        totals = dict(self.totals)
+        for name in self.totals:
+            self.totals[name] = 0.0
+        return totals
+
+
+class Scenario:
+    """ One benchmark: setup() once, then prepare() and a timed run_once() per iteration """
+    name = ""
+    iterations = 100
+    needs_window = False
+
+    def setup(self, window):
+        pass
+
+    def prepare(self):
+        """ Untimed work before each iteration """
+        pass
+
+    def run_once(self):
+        raise NotImplementedError
+
+    def teardown(self):
+        pass
+
+
+class ColdLevelLoad(Scenario):
+    """ Set up one level in a fresh headless view with every texture cache emptied """
+    iterations = 20
+
+    def __init__(self, level):
+        self.level = level
+        self.name = f"cold_load_level_{level}"
+        self.view = None
+
+    def prepare(self):
+        self._close_view()
+        arcade.cleanup_texture_cache()
+        entities.clear_character_textures()
+        self.view = GameView(headless=True)
+        self.view.level = self.level
+
+    def run_once(self):
+        self.view.setup()
+
+    def teardown(self):
+        self._close_view()
+
+    def _close_view(self):
+        if self.view is not None:
+            # Let the next level's prefetch finish so it doesn't compete with the next load
+            self.view.level_prefetcher.shutdown(wait=True)
+            self.view = None
+
+
+def write_wide_level(directory, copies=WIDE_LEVEL_COPIES):
+    """ Write level 1 repeated copies times side by side into directory as its level 1, compiled
+
+    The goal is left out so the level can be crossed end to end.
+    """
+    source = levels.level_map_path(1)
+    tiled_map = json.loads(source.read_text())
+    width = tiled_map["width"]
+    map_width = width * tiled_map["tilewidth"]
+    next_id = tiled_map["nextobjectid"]
+    for layer in tiled_map["layers"]:
+        if layer["type"] == "tilelayer":
+            data = [0] * len(layer["data"]) if layer["name"] == "Goal" else layer["data"]
+            layer["data"] = [gid for row in range(layer["height"]) for gid in data[row * width:(row + 1) * width] * copies]
+            layer["width"] = width * copies
+        elif layer["name"] == "Enemies":
+            objects = []
+            for copy in range(copies):
+                for tiled_object in layer["objects"]:
+                    objects.append(dict(tiled_object, id=next_id, x=tiled_object["x"] + copy * map_width))
+                    next_id += 1
+            layer["objects"] = objects
+    tiled_map["width"] = width * copies
+    tiled_map["nextobjectid"] = next_id
+    for tileset in tiled_map["tilesets"]:
+        tileset["source"] = str((source.parent / tileset["source"]).resolve())
+
+    path = pathlib.Path(directory) / "level_1.json"
+    path.write_text(json.dumps(tiled_map))
+    levels.compile_level(path)
+    return path
+
+
+class WideLevelLoad(ColdLevelLoad):
+    """ Set up the wide level, which is streamed, in a fresh headless view """
+    name = "cold_load_wide_level"
+
+    def __init__(self):
+        super().__init__(1)
+        self.name = WideLevelLoad.name
+
+    def setup(self, window):
+        self.directory = tempfile.TemporaryDirectory()
+        write_wide_level(self.directory.name)
+
+    def prepare(self):
+        super().prepare()
+        self.view.maps_path = self.directory.name
+
+    def teardown(self):
+        super().teardown()
+        self.directory.cleanup()
+
+
+class StreamedFlyover(Scenario):
+    """ Carry the player back and forth across the wide level, loading and unloading chunks on the way """
+    name = "streamed_flyover"
+    iterations = 3000
+
+    def setup(self, window):
+        self.directory = tempfile.TemporaryDirectory()
+        write_wide_level(self.directory.name)
+        self.runner = HeadlessRunner(1, maps_path=self.directory.name)
+        self.direction = 1
+
+    def prepare(self):
+        view = self.runner.view
+        x = view.player_sprite.center_x + self.direction * FLYOVER_SPEED
+        if not 0 < x < view.map_width:
+            self.direction = -self.direction
+        # High enough to clear the level's platforms, touching an enemy on the way doesn't end the run
+        view.physics_engine.set_position(view.player_sprite, (x, view.map_height - game.SPRITE_SIZE))
+        view.physics_engine.set_velocity(view.player_sprite, (0, 0))
+        view.outcome = None
+
+    def run_once(self):
+        self.runner.step()
+
+    def teardown(self):
+        self.runner.close()
+        self.directory.cleanup()
+
+
+class BulletStorm(Scenario):
+    """ Keep 1,000 bullets flying around the player on level 1 """
+    name = "bullets_1000"
+    iterations = 600
+    bullet_count = 1000
+
+    def setup(self, window):
+        self.runner = HeadlessRunner(1)
+        self.runner.view.bullet_pool.capacity = self.bullet_count
+        self.random = random.Random(0)
+
+    def prepare(self):
+        view = self.runner.view
+        pool = view.bullet_pool
+        player_x, player_y = view.player_sprite.position
+        while len(pool.active) < self.bullet_count:
+            # Somewhere on the screen around the player, in any direction
+            position = (max(0, player_x + self.random.uniform(-0.5, 0.5) * game.SCREEN_WIDTH),
+                        max(0, player_y + self.random.uniform(-0.5, 0.5) * game.SCREEN_HEIGHT))
+            pool.fire(position, self.random.uniform(0, 2 * math.pi))
+
+    def run_once(self):
+        self.runner.step()
+
+    def teardown(self):
+        self.runner.close()
+
+
+class RobotHorde(Scenario):
+    """ 200 RobotEnemy sprites chasing a player standing still on level 1 """
+    name = "robots_200_chasing"
+    iterations = 600
+    robot_count = 200
+
+    def setup(self, window):
+        self.runner = HeadlessRunner(1)
+        view = self.runner.view
+        player_x, player_y = view.player_sprite.position
+        for index in range(self.robot_count):
+            # A block of robots to the right of the player, all within chase range
+            robot = RobotEnemy()
+            robot.center_x = player_x + 80 + (index % 20) * 25
+            robot.center_y = player_y + 40 + (index // 20) * 70
+            view.enemy_list.append(robot)
+            view.add_enemy_body(robot)
+
+    def run_once(self):
+        self.runner.step()
+
+    def teardown(self):
+        self.runner.close()
+
+
+class RecordedSession(Scenario):
+    """ A recorded play session replayed tick by tick, from the start again once it ends """
+    def __init__(self, path):
+        self.recording = InputRecording.load(path)
+        self.name = f"replay_{os.path.splitext(os.path.basename(path))[0]}"
+        self.iterations = self.recording.result["ticks"]
+
+    def setup(self, window):
+        self.runner = None
+
+    def prepare(self):
+        if self.runner is None or self.runner.view.outcome is not None or \
+                self.runner.tick >= self.recording.result["ticks"]:
+            if self.runner is not None:
+                self.runner.close()
+            self.runner = HeadlessRunner(self.recording.level, ScriptedInput(self.recording.events))
+
+    def run_once(self):
+        self.runner.step()
+
+    def teardown(self):
+        self.runner.close()
+
+
+class Playthrough(RecordedSession):
+    """ Every level in turn, played to its goal from a recorded input script
+
+    The recording is the goal bot of playtest.py playing the whole game,
+    saved with python playtest.py --record-playthrough. Replaying fixed
+    input keeps the scenario comparable between commits; record it again
+    when a change to the gameplay means it no longer matches.
+    """
+    def __init__(self):
+        super().__init__(PLAYTHROUGH_RECORDING)
+        self.name = "playthrough_levels_1_to_4"
+
+
+class RestartLoop(Scenario):
+    """ Restart from GameOverView with ENTER, up to the new game's first drawn frame """
+    name = "restart_via_game_over"
+    iterations = 20
+    needs_window = True
+
+    def setup(self, window):
+        self.window = window
+        game_view = GameView()
+        game_view.setup()
+        window.show_view(game_view)
+
+    def prepare(self):
+        # Play a second of the level first, so the restart has something to undo
+        game_view = self.window.current_view
+        script = run_right_script(60)
+        for tick in range(60):
+            script.apply(tick, game_view)
+            game_view.fixed_update(game.FIXED_DELTA_TIME)
+        self.window.show_view(GameOverView(game_view))
+
+    def run_once(self):
+        self.window.current_view.on_key_press(arcade.key.ENTER, 0)
+        self.window.current_view.on_draw()
+        self.window.ctx.finish()
+
+    def teardown(self):
+        self.window.current_view.level_prefetcher.shutdown(wait=True)
+
+
+class FramesLevel1(Scenario):
+    """ Whole frames of level 1 in a window, on_update and on_draw, holding right and jumping """
+    name = "frames_level_1"
+    iterations = 600
+    needs_window = True
+
+    def setup(self, window):
+        self.window = window
+        self.game_view = None
+        self._start()
+
+    def prepare(self):
+        if self.game_view.outcome is not None:
+            self._start()
+
+    def run_once(self):
+        self.script.apply(self.tick, self.game_view)
+        self.tick += 1
+        self.game_view.on_update(game.FIXED_DELTA_TIME)
+        self.game_view.on_draw()
+        self.window.ctx.finish()
+
+    def teardown(self):
+        self.game_view.level_prefetcher.shutdown(wait=True)
+
+    def _start(self):
+        if self.game_view is not None:
+            self.game_view.level_prefetcher.shutdown(wait=True)
+        self.game_view = GameView()
+        self.game_view.setup()
+        self.window.show_view(self.game_view)
+        self.script = run_right_script(self.iterations)
+        self.tick = 0
+
+
+def all_scenarios():
+    """ Every scenario, in the order they run """
+    scenarios = [ColdLevelLoad(level) for level in range(1, game.LEVEL_COUNT + 1)]
+    scenarios += [WideLevelLoad(), BulletStorm(), RobotHorde(), StreamedFlyover(), Playthrough(), RestartLoop(),
+                  FramesLevel1()]
+    return scenarios
+
+
+def percentile(sorted_values, fraction):
+    """ Nearest-rank percentile of an already sorted list """
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(seconds):
+    """ p50/p95/p99, mean and max of a list of durations, in milliseconds """
+    values = sorted(value * 1000 for value in seconds)
+    return {
+        "p50": round(percentile(values, 0.50), 4),
+        "p95": round(percentile(values, 0.95), 4),
+        "p99": round(percentile(values, 0.99), 4),
+        "mean": round(sum(values) / len(values), 4),
+        "max": round(values[-1], 4),
+    }
+
+
+def measure(scenario, window, allocation_iterations):
+    """ Time a scenario, then run it again under tracemalloc for its allocations """
+    scenario.setup(window)
+    try:
+        frame_times = []
+        subsystem_times = {name: [] for name in SUBSYSTEMS}
+        with SubsystemTimer() as timer:
+            for _ in range(scenario.iterations):
+                scenario.prepare()
+                timer.take()
+                start = time.perf_counter()
+                scenario.run_once()
+                frame_times.append(time.perf_counter() - start)
+                for name, total in timer.take().items():
+                    subsystem_times[name].append(total)
+
+        allocated = []
+        peak = 0
+        tracemalloc.start()
+        try:
+            for _ in range(min(allocation_iterations, scenario.iterations)):
+                scenario.prepare()
+                before = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                scenario.run_once()
+                current, iteration_peak = tracemalloc.get_traced_memory()
+                allocated.append(current - before)
+                peak = max(peak, iteration_peak - before)
+        finally:
+            tracemalloc.stop()
+    finally:
+        scenario.teardown()
+
+    result = summarize(frame_times)
+    result["iterations"] = len(frame_times)
+    result["subsystems"] = {name: summarize(times) for name, times in subsystem_times.items() if any(times)}
+    allocated.sort()
+    result["allocated_bytes_per_iteration"] = allocated[len(allocated) // 2] if allocated else 0
+    result["peak_bytes"] = peak
+    return result
+
+
+def compare(results, baseline, threshold):
+    """ Print p95 ratios against a baseline run, returning how many regressed past threshold """
+    regressions = 0
+    for name, result in results["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if old is None:
+            continue
+        pairs = [(name, result, old)]
+        for subsystem, timing in result["subsystems"].items():
+            if subsystem in old.get("subsystems", {}):
+                pairs.append((f"{name} / {subsystem}", timing, old["subsystems"][subsystem]))
+        for label, new_timing, old_timing in pairs:
+            if old_timing["p95"] < MIN_COMPARED_MS:
+                continue
+            ratio = new_timing["p95"] / old_timing["p95"]
+            flag = ""
+            if ratio > threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"{label}: p95 {old_timing['p95']:.3f} -> {new_timing['p95']:.3f} ms (x{ratio:.2f}){flag}")
+    return regressions
+
+
+def open_window():
+    """ A hidden window for the drawing scenarios, or None if there is no OpenGL """
+    try:
+        return arcade.Window(game.SCREEN_WIDTH, game.SCREEN_HEIGHT, game.SCREEN_TITLE, visible=False)
+    except Exception as e:
+        print(f"No window available, skipping drawing scenarios: {e}")
+        return None
+
+
+def current_commit():
+    """ Short hash of the checked out commit, if this is a git checkout """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    """ Run the scenarios and save the results """
+    parser = argparse.ArgumentParser(description="Run the performance scenarios")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the JSON results")
+    parser.add_argument("--compare", help="earlier results to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="p95 ratio against --compare that counts as a regression")
+    parser.add_argument("--only", action="append", help="run only scenarios whose name contains this")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every scenario's iterations")
+    parser.add_argument("--allocation-iterations", type=int, default=50,
+                        help="iterations of each scenario run under tracemalloc")
+    parser.add_argument("--no-window", action="store_true", help="skip the scenarios that draw")
+    parser.add_argument("--replay", action="append", default=[], help="input recording to add as a scenario")
+    args = parser.parse_args()
+
+    scenarios = all_scenarios() + [RecordedSession(path) for path in args.replay]
+    if args.only:
+        scenarios = [scenario for scenario in scenarios if any(part in scenario.name for part in args.only)]
+
+    window = None
+    if not args.no_window and any(scenario.needs_window for scenario in scenarios):
+        window = open_window()
+
+    results = {
+        "commit": current_commit(),
+        "python": platform.python_version(),
+        "arcade": arcade.version.VERSION,
+        "platform": platform.platform(),
+        "renderer": window.ctx.info.RENDERER if window is not None else None,
+        "scenarios": {},
+    }
+    for scenario in scenarios:
+        if scenario.needs_window and window is None:
+            continue
+        scenario.iterations = max(1, round(scenario.iterations * args.scale))
+        result = measure(scenario, window, args.allocation_iterations)
+        results["scenarios"][scenario.name] = result
+        print(f"{scenario.name}: p50 {result['p50']:.3f} ms, p95 {result['p95']:.3f} ms, "
+              f"p99 {result['p99']:.3f} ms, {result['allocated_bytes_per_iteration']} B/iteration")
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import math
+import arcade
+import constants as game
+
+
+class BulletPool:
+    """ Fixed set of bullet sprites and pymunk bodies, reused shot after shot
+
+    A spent bullet is parked: its body and shape leave the pymunk space and the
+    sprite leaves bullet_list, but both are kept for the next shot. Bullets
+    despawn on hitting something, after BULLET_LIFETIME seconds, or when they
+    leave the map. When every bullet is in flight the oldest one is reused.
+    """
+    def __init__(self, physics_engine, bullet_list, map_width, map_height, capacity=game.BULLET_POOL_SIZE):
+        self.physics_engine = physics_engine
+        self.bullet_list = bullet_list
+        self.map_width = map_width
+        self.map_height = map_height
+        self.capacity = capacity
+
+        # Bullets in flight mapped to their age in seconds, oldest first
+        self.active = {}
+
+        # Parked bullets ready to be fired again
+        self.free = []
+
+        # Every bullet by its pymunk shape, for collision callbacks that only get shapes
+        self.shapes = {}
+
+    def fire(self, position, angle):
+        """ Launch a bullet from position in the direction of angle (radians) """
+        velocity = (game.BULLET_SPEED * math.cos(angle), game.BULLET_SPEED * math.sin(angle))
+
+        if not self.free and len(self.active) >= self.capacity:
+            # Pool exhausted, recycle the oldest bullet in flight
+            self.release(next(iter(self.active)))
+
+        if self.free:
+            bullet = self.free.pop()
+            bullet.position = position
+            bullet.angle = math.degrees(angle)
+
+            # Put the parked body back in the space where the shot starts
+            physics_object = self.physics_engine.get_physics_object(bullet)
+            body = physics_object.body
+            body.position = position
+            body.angle = angle
+            body.velocity = velocity
+            body.angular_velocity = 0
+            self.physics_engine.space.add(body, physics_object.shape)
+            self.physics_engine.non_static_sprite_list.append(bullet)
+        else:
+            bullet = self._create(position, angle)
+            self.physics_engine.set_velocity(bullet, velocity)
+
+        self.bullet_list.append(bullet)
+        self.active[bullet] = 0.0
+        return bullet
+
+    def release(self, bullet):
+        """ Take a bullet out of play and park it for reuse """
+        if bullet not in self.active:
+            return
+        del self.active[bullet]
+
+        physics_object = self.physics_engine.get_physics_object(bullet)
+        self.physics_engine.space.remove(physics_object.body, physics_object.shape)
+        self.physics_engine.non_static_sprite_list.remove(bullet)
+
+        self.bullet_list.remove(bullet)
+        self.free.append(bullet)
+
+    def release_all(self):
+        """ Park every bullet in flight """
+        for bullet in list(self.active):
+            self.release(bullet)
+
+    def bullet_for_shape(self, shape):
+        """ The bullet a pymunk shape belongs to, or None """
+        return self.shapes.get(shape)
+
+    def update(self, delta_time):
+        """ Age bullets in flight and despawn expired or off-map ones """
+        for bullet in list(self.active):
+            age = self.active[bullet] + delta_time
+            self.active[bullet] = age
+            if age > game.BULLET_LIFETIME or \
+                    not 0 <= bullet.center_x <= self.map_width or \
+                    not 0 <= bullet.center_y <= self.map_height:
+                self.release(bullet)
+
+    def _create(self, position, angle):
+        """ Make a new bullet and its physics body """
+        bullet = arcade.Sprite(
+                    ":resources:images/space_shooter/laserBlue01.png",
+                    game.SPRITE_SCALING_LASER
+                )
+        bullet.position = position
+        bullet.angle = math.degrees(angle)
+
+        bullet_gravity = (0, -game.BULLET_GRAVITY)
+
+        # Add the sprite. This needs to be done AFTER setting the fields above.
+        self.physics_engine.add_sprite(bullet,
+                                       mass=game.BULLET_MASS,
+                                       damping=1.0,
+                                       friction=0.6,
+                                       collision_type="bullet",
+                                       gravity=bullet_gravity,
+                                       elasticity=0.9)
+        self.shapes[self.physics_engine.get_physics_object(bullet).shape] = bullet
+        return bullet
@@ -0,0 +1,111 @@
+"""Gameplay state of every entity in parallel arrays
+
+Each Entity owns one row of an EntityStore. Only state that a vectorized
+system reads as a column lives there: the animation state AnimationSystem
+steps, and the speeds, chase ranges and boundaries EnemySystem steers by.
+A system indexes the store's arrays with the rows of all its entities in
+one go instead of visiting each sprite. The entity's attributes for these
+fields are properties reading and writing its row, and the rest of its
+state is plain attributes.
+"""
+import weakref
+import numpy as np
+
+# Name, dtype and starting value of each field
+FIELDS = (
+    ("cur_texture", np.int16, 0),
+    ("face", np.int8, 0),
+    ("x_odometer", np.float64, 0.0),
+    ("y_odometer", np.float64, 0.0),
+    ("speed", np.float64, 0.0),
+    ("chase_range", np.float64, 0.0),
+    # NaN for no boundary
+    ("boundary_left", np.float64, np.nan),
+    ("boundary_right", np.float64, np.nan),
+    # Animated character and the frame table index of the texture on show, see animation.py
+    ("character", np.int16, 0),
+    ("shown", np.int32, -1),
+    # Position at the last animation step, NaN before the first
+    ("last_x", np.float64, np.nan),
+    ("last_y", np.float64, np.nan),
+)
+
+
+class EntityStore:
+    """ Rows of entity state, one array per field
+
+    Rows of entities that were garbage collected are reused. The arrays are
+    replaced when the store grows, so look them up on the store each time
+    rather than keeping them.
+    """
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        for name, dtype, default in FIELDS:
+            setattr(self, name, np.full(capacity, default, dtype=dtype))
+
+        # Which rows belong to a live entity
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.free = list(range(capacity - 1, -1, -1))
+
+    def allocate(self, owner):
+        """ A row with every field at its starting value, released when owner is garbage collected """
+        if not self.free:
+            self._grow()
+        row = self.free.pop()
+        for name, _dtype, default in FIELDS:
+            getattr(self, name)[row] = default
+        self.alive[row] = True
+        weakref.finalize(owner, self.release, row)
+        return row
+
+    def save_rows(self, rows):
+        """ Copies of every field for some rows, to put back with restore_rows() """
+        return {name: getattr(self, name)[rows].copy() for name, _dtype, _default in FIELDS}
+
+    def restore_rows(self, rows, saved):
+        for name, values in saved.items():
+            getattr(self, name)[rows] = values
+
+    def release(self, row):
+        self.alive[row] = False
+        self.free.append(row)
+
+    def _grow(self):
+        """ Double the capacity, keeping every row """
+        old_capacity = self.capacity
+        self.capacity *= 2
+        for name, dtype, default in FIELDS:
+            array = np.full(self.capacity, default, dtype=dtype)
+            array[:old_capacity] = getattr(self, name)
+            setattr(self, name, array)
+        alive = np.zeros(self.capacity, dtype=bool)
+        alive[:old_capacity] = self.alive
+        self.alive = alive
+        self.free.extend(range(self.capacity - 1, old_capacity - 1, -1))
+
+
+# The store every entity keeps its state in
+entity_store = EntityStore()
+
+
+def stored(name, doc=None):
+    """ A property for a field of the owning entity's row in entity_store """
+    def get(self):
+        return getattr(entity_store, name).item(self.row)
+
+    def set(self, value):
+        getattr(entity_store, name)[self.row] = value
+
+    return property(get, set, doc=doc)
+
+
+def stored_optional(name, doc=None):
+    """ Like stored(), for a float field where None is kept as NaN """
+    def get(self):
+        value = getattr(entity_store, name).item(self.row)
+        return None if value != value else value
+
+    def set(self, value):
+        getattr(entity_store, name)[self.row] = np.nan if value is None else value
+
+    return property(get, set, doc=doc)
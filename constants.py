@@ -1,7 +1,7 @@
 import pathlib
 
 # Assets path
-ASSETS_PATH = pathlib.Path(__file__).resolve().parent.parent / "Kyle_Capstone_Project" / "assets"
+ASSETS_PATH = pathlib.Path(__file__).resolve().parent / "assets"
 
 # How much force to put on the bullet
 BULLET_MOVE_FORCE = 4500
@@ -12,6 +12,15 @@ BULLET_GRAVITY = 300
 # Mass of the bullet
 BULLET_MASS = 0.1
 
+# Speed of a fired bullet
+BULLET_SPEED = 5000
+
+# Seconds a bullet stays in flight before it is despawned
+BULLET_LIFETIME = 3.0
+
+# Most bullets in flight at once, older ones are reused past this
+BULLET_POOL_SIZE = 50
+
 # Close enough to not-moving to have the animation go to idle.
 DEAD_ZONE = 0.1
 
@@ -27,6 +36,12 @@ DYNAMIC_ITEM_FRICTION = 0.6
 # Gravity
 GRAVITY = 1500
 
+# Seconds of game time simulated by one physics and AI step
+FIXED_DELTA_TIME = 1 / 60
+
+# Most steps run in one frame to catch up, time beyond that is dropped
+MAX_SIMULATION_STEPS = 5
+
 # Mass (defaults to 1)
 PLAYER_MASS = 2.0
 
@@ -74,8 +89,77 @@ SCREEN_GRID_HEIGHT = 15
 SCREEN_WIDTH = SPRITE_SIZE * SCREEN_GRID_WIDTH
 SCREEN_HEIGHT = SPRITE_SIZE * SCREEN_GRID_HEIGHT
 
+# Static tile layers are drawn in square chunks this many tiles wide
+RENDER_CHUNK_TILES = 16
+
+# Extra pixels around the camera whose chunks are drawn too
+RENDER_MARGIN = SPRITE_SIZE
+
+# Render the Background and Platforms layers once per level into offscreen textures
+BAKE_STATIC_LAYERS = True
+
+# Start with the frame profiler on, otherwise F3 turns it on with its overlay
+PROFILER_ENABLED = False
+
+# Frames in the profiler's rolling averages
+PROFILER_WINDOW = 120
+
+# Seconds between refreshes of the profiler overlay text
+PROFILER_OVERLAY_REFRESH = 0.25
+
+# Where F4 writes the frame trace, a .json path writes JSON instead of CSV
+PROFILER_TRACE_PATH = "profile_trace.csv"
+
+# Record every run's input from its first level, saved when the run ends or on F5
+INPUT_RECORDING_ENABLED = False
+
+# Where input recordings are saved
+INPUT_RECORDING_PATH = "input_recording.json"
+
+# How far in pixels a replay may end from the recorded player position and still match
+REPLAY_POSITION_TOLERANCE = 1.0
+
+# Dormant enemies wake when the player comes this close
+ENEMY_ACTIVATION_RADIUS = 1000
+
+# Awake enemies go dormant when the player is further away than this
+ENEMY_DEACTIVATION_RADIUS = 1200
+
+# Dormant enemies also wake within this many pixels of the camera's view, and awake ones stay awake
+# within the larger margin, so enemies on screen keep moving where the camera stops at the map's edges
+ENEMY_ACTIVATION_MARGIN = SPRITE_SIZE
+ENEMY_DEACTIVATION_MARGIN = SPRITE_SIZE * 3
+
+# Compiled levels with more tile cells than this are streamed in chunks around the player
+STREAMING_MIN_CELLS = 20000
+
+# Tiles along each side of a streamed chunk, the same as a render chunk so each fills one
+STREAM_CHUNK_TILES = RENDER_CHUNK_TILES
+
+# Chunks closer than this to the player are loaded. Enemies and items are only simulated
+# within ENEMY_DEACTIVATION_RADIUS, this leaves room for the ground under them
+STREAM_LOAD_RADIUS = 2400
+
+# Loaded chunks further than this are unloaded, the gap stops chunks on the edge flickering in and out
+STREAM_UNLOAD_RADIUS = 3000
+
+# Unloaded chunks kept built, so walking back into one only puts its sprites and shapes back
+STREAM_CACHE_CHUNKS = 32
+
+# Empty cells an enemy needs above its feet to fit in a spot
+NAV_HEADROOM_CELLS = 2
+
+# Highest step, in cells, an enemy will jump up
+NAV_JUMP_CELLS = 2
+
+# How strongly a climbing enemy is pulled towards the middle of its ladder, per second
+NAV_CENTERING_RATE = 10
+
 # Screen title
 SCREEN_TITLE = "ROBOGEDDON"
+
+# Number of levels, the player wins after the last one
+LEVEL_COUNT = 4
 SPRITE_SCALING_LASER = 0.8
 
 # Friction between objects
@@ -0,0 +1,250 @@
+import math
+import arcade
+import numpy as np
+import constants as game
+from components import entity_store
+from navigation import ARRIVED, MOVE_CLIMB, MOVE_DIRECTION, NONE, FlowField, NavigationGraph
+
+# Enemies only start a jump while moving up or down slower than this, standing on the ground
+JUMP_READY_SPEED = 1.0
+
+
+class EnemySystem:
+    """ Chase AI for every enemy of a level, in one vectorized pass
+
+    Each enemy's size and its row in entity_store are copied into arrays
+    when it joins the level. A step then gathers the positions, takes the
+    speeds, chase ranges and boundaries from the store, works out every
+    velocity with NumPy and writes the velocities straight to the pymunk
+    bodies in a single loop. Enemies chase the player while
+    within chase_range along a shared flow field towards the player's cell:
+    walking, dropping off ledges, jumping up steps and climbing ladders.
+    Off the field, or in the player's own cell, they head straight for the
+    player and stop where there is no ground ahead. They turn round past
+    their boundaries.
+
+    Enemies further than ENEMY_DEACTIVATION_RADIUS from the player, and more
+    than ENEMY_DEACTIVATION_MARGIN outside the camera's view, go dormant:
+    their bodies leave the pymunk space and they are skipped by the AI and
+    animation, keeping their position and state. Dormant enemies are
+    bucketed by area, so only those near the player or the view are checked
+    each step. They wake once the player is within ENEMY_ACTIVATION_RADIUS
+    or they are within ENEMY_ACTIVATION_MARGIN of the view.
+    """
+    def __init__(self, enemy_list, platform_grid, ladder_grid, physics_engine, navigation=None):
+        self.enemy_list = enemy_list
+        self.physics_engine = physics_engine
+
+        # Awake enemies, and the ones the arrays below were built for, in the same order
+        self.active_list = arcade.SpriteList()
+        self.enemies = []
+        self.bodies = []
+
+        # Which of self.enemies stood on a platform at the last step
+        self.grounded = np.zeros(0, dtype=bool)
+
+        # Dormant enemies by (column, row) of ENEMY_ACTIVATION_RADIUS sized areas
+        self.dormant = {}
+        self.dormant_count = 0
+
+        # Per column running count of platform cells, so a vertical ground probe is one subtraction
+        cells = np.frombuffer(platform_grid.cells, dtype=np.uint8).reshape(platform_grid.rows, platform_grid.columns)
+        self.ground_totals = np.zeros((platform_grid.columns, platform_grid.rows + 1), dtype=np.int32)
+        self.ground_totals[:, 1:] = np.cumsum(cells.T, axis=1)
+        self.columns = platform_grid.columns
+        self.rows = platform_grid.rows
+        self.cell_width = platform_grid.cell_width
+        self.cell_height = platform_grid.cell_height
+
+        # Routes towards the player, rebuilt only when the player changes cell. The graph only depends on the
+        # level, so it can come prepared with it
+        self.navigation = navigation if navigation is not None else NavigationGraph(platform_grid, ladder_grid)
+        self.flow_field = FlowField(self.navigation)
+
+        # Upward speed for a jump of each number of cells, with half a cell to spare
+        self.jump_speed = np.sqrt(2 * game.GRAVITY * (np.arange(game.NAV_JUMP_CELLS + 1) + 0.5) * self.cell_height)
+
+        self._add_new_enemies()
+
+    def _add_new_enemies(self):
+        """ Start tracking enemies added to enemy_list, awake """
+        tracked = set(self.active_list)
+        for enemies in self.dormant.values():
+            tracked.update(enemies)
+        for enemy in self.enemy_list:
+            if enemy not in tracked:
+                self.active_list.append(enemy)
+
+    def reset(self):
+        """ Wake every enemy in enemy_list without touching the space, once their bodies are back in it """
+        self.dormant = {}
+        self.dormant_count = 0
+        self.active_list.clear()
+        self.active_list.extend(self.enemy_list)
+        self.enemies = []
+
+    def _area(self, x, y):
+        """ The dormant bucket a point falls in """
+        return math.floor(x / game.ENEMY_ACTIVATION_RADIUS), math.floor(y / game.ENEMY_ACTIVATION_RADIUS)
+
+    def _sleep(self, enemy):
+        """ Take an enemy's body out of the space and park the enemy """
+        physics_object = self.physics_engine.get_physics_object(enemy)
+        self.physics_engine.space.remove(physics_object.body, physics_object.shape)
+        self.physics_engine.non_static_sprite_list.remove(enemy)
+        self.active_list.remove(enemy)
+        self.dormant.setdefault(self._area(enemy.center_x, enemy.center_y), []).append(enemy)
+        self.dormant_count += 1
+
+    def _wake(self, enemy):
+        """ Put a parked enemy's body back in the space """
+        physics_object = self.physics_engine.get_physics_object(enemy)
+        self.physics_engine.space.add(physics_object.body, physics_object.shape)
+        self.physics_engine.non_static_sprite_list.append(enemy)
+        self.active_list.append(enemy)
+
+    def _wake_near(self, player_x, player_y, view):
+        """ Wake the dormant enemies within ENEMY_ACTIVATION_RADIUS of the player or in sight of the camera """
+        radius = game.ENEMY_ACTIVATION_RADIUS
+        margin = game.ENEMY_ACTIVATION_MARGIN
+        left, bottom, right, top = view[0] - margin, view[1] - margin, view[2] + margin, view[3] + margin
+        column, row = self._area(player_x, player_y)
+        keys = {(column + dx, row + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)}
+        first_column, first_row = self._area(left, bottom)
+        last_column, last_row = self._area(right, top)
+        keys.update((column, row) for column in range(first_column, last_column + 1)
+                    for row in range(first_row, last_row + 1))
+        for key in keys:
+            enemies = self.dormant.get(key)
+            if not enemies:
+                continue
+            still_dormant = []
+            for enemy in enemies:
+                if (enemy.center_x - player_x) ** 2 + (enemy.center_y - player_y) ** 2 < radius * radius or \
+                        left <= enemy.center_x <= right and bottom <= enemy.center_y <= top:
+                    self._wake(enemy)
+                    self.dormant_count -= 1
+                else:
+                    still_dormant.append(enemy)
+            if still_dormant:
+                self.dormant[key] = still_dormant
+            else:
+                del self.dormant[key]
+
+    def _sync_enemies(self):
+        """ Rebuild the arrays after enemies woke, went dormant or were killed """
+        enemies = list(self.active_list)
+        self.enemies = enemies
+        self.bodies = [self.physics_engine.get_physics_object(enemy).body for enemy in enemies]
+        self.store_rows = np.array([enemy.row for enemy in enemies], dtype=np.intp)
+        self.half_width = np.array([enemy.width / 2 for enemy in enemies], dtype=float)
+        self.height = np.array([enemy.height for enemy in enemies], dtype=float)
+        self.foot_offset = np.array([enemy.center_y - enemy.bottom for enemy in enemies], dtype=float)
+
+    def ground_ahead(self, x, y, change_x):
+        """ Is there a platform under a 1 pixel wide probe, as tall as the enemy, at each leading edge """
+        direction = np.where(change_x > 0, 1.0, -1.0)
+        front_x = x + self.half_width * direction
+
+        first_column = np.maximum(0, np.floor((front_x - 0.5) / self.cell_width)).astype(np.intp)
+        last_column = np.minimum(self.columns - 1, np.ceil((front_x + 0.5) / self.cell_width) - 1).astype(np.intp)
+        first_row = np.maximum(0, np.floor((y - self.height) / self.cell_height)).astype(np.intp)
+        last_row = np.minimum(self.rows - 1, np.ceil(y / self.cell_height) - 1).astype(np.intp)
+        inside = (first_column <= last_column) & (first_row <= last_row)
+
+        # The probe is narrower than a cell, so it covers at most the first and last column
+        first_column = np.clip(first_column, 0, self.columns - 1)
+        last_column = np.clip(last_column, 0, self.columns - 1)
+        bottom = np.clip(first_row, 0, self.rows)
+        top = np.clip(last_row + 1, 0, self.rows)
+        totals = self.ground_totals
+        found = (totals[first_column, top] - totals[first_column, bottom] > 0) | \
+                (totals[last_column, top] - totals[last_column, bottom] > 0)
+        return inside & found
+
+    def update(self, delta_time, player_sprite, view):
+        """ Steer every awake enemy for one step, with view the (left, bottom, right, top) the camera shows """
+        # Killed enemies leave active_list too, so a difference means enemies were added
+        if len(self.enemy_list) != len(self.active_list) + self.dormant_count:
+            self._add_new_enemies()
+        if self.dormant:
+            self._wake_near(player_sprite.center_x, player_sprite.center_y, view)
+        if self.active_list.sprite_list != self.enemies:
+            self._sync_enemies()
+        if not self.enemies:
+            self.grounded = np.zeros(0, dtype=bool)
+            return
+
+        store_rows = self.store_rows
+        speed = entity_store.speed[store_rows]
+        positions = np.array([enemy.position for enemy in self.enemies], dtype=float)
+        x = positions[:, 0]
+        y = positions[:, 1]
+        velocity_y = np.array([body.velocity.y for body in self.bodies], dtype=float)
+
+        # Chase the player if within range
+        dx = player_sprite.center_x - x
+        dy = player_sprite.center_y - y
+        distance = np.sqrt(dx * dx + dy * dy)
+        chasing = distance < entity_store.chase_range[store_rows]
+        dx = np.divide(dx, distance, out=dx, where=distance != 0)
+        change_x = np.where(chasing, dx * speed, 0.0)
+
+        # Look up each enemy's next move from the cell under the middle of its feet, or else under either side.
+        # An enemy with a platform cell below any of them is on the ground
+        self.flow_field.retarget(player_sprite.center_x, player_sprite.bottom + 1)
+        row = np.floor((y - self.foot_offset + 1) / self.cell_height).astype(np.intp)
+        move = np.full(len(self.enemies), NONE, dtype=np.int8)
+        cell = np.zeros(len(self.enemies), dtype=np.intp)
+        column = np.zeros(len(self.enemies), dtype=np.intp)
+        grounded = np.zeros(len(self.enemies), dtype=bool)
+        for offset in (0.0, -0.5, 0.5):
+            sample_column = np.floor((x + self.half_width * offset) / self.cell_width).astype(np.intp)
+            inside = (sample_column >= 0) & (sample_column < self.columns) & (row >= 0) & (row < self.rows)
+            sample_cell = np.where(inside, row * self.columns + sample_column, 0)
+            below_column = np.clip(sample_column, 0, self.columns - 1)
+            below_row = np.clip(row, 1, self.rows)
+            grounded |= inside & (row > 0) & \
+                (self.ground_totals[below_column, below_row] - self.ground_totals[below_column, below_row - 1] > 0)
+            found = (move == NONE) & inside & (self.flow_field.move[sample_cell] != NONE)
+            move[found] = self.flow_field.move[sample_cell[found]]
+            cell[found] = sample_cell[found]
+            column[found] = sample_column[found]
+        routed = chasing & (move != NONE) & (move != ARRIVED)
+
+        # Off the field, stop if there's no ground ahead
+        change_x[chasing & ~routed & ~self.ground_ahead(x, y, change_x)] = 0.0
+        change_x = np.where(routed, MOVE_DIRECTION[move] * speed, change_x)
+
+        # Keep climbers in the middle of the ladder
+        climb = MOVE_CLIMB[move]
+        climbing = routed & (climb != 0)
+        to_middle = np.clip(((column + 0.5) * self.cell_width - x) * game.NAV_CENTERING_RATE, -speed, speed)
+        change_x = np.where(climbing, to_middle, change_x)
+
+        # Climb ladders and jump up steps, otherwise gravity moves enemies up and down
+        velocity_y = np.where(climbing | (routed & self.navigation.holds[cell]), climb * speed, velocity_y)
+        jump = np.where(routed, self.flow_field.jump[cell], 0)
+        jumping = (jump > 0) & grounded & (np.abs(velocity_y) < JUMP_READY_SPEED)
+        velocity_y = np.where(jumping, self.jump_speed[jump], velocity_y)
+
+        for body, velocity_x, body_velocity_y in zip(self.bodies, change_x.tolist(), velocity_y.tolist()):
+            body.velocity = (velocity_x, body_velocity_y)
+
+        # Reverse direction past a boundary, once for each boundary crossed. Missing boundaries are NaN,
+        # which never compares as crossed
+        reversals = (x < entity_store.boundary_left[store_rows]).astype(int) + \
+            (x > entity_store.boundary_right[store_rows])
+        change_x[reversals % 2 == 1] *= -1
+
+        for enemy, enemy_change_x in zip(self.enemies, change_x.tolist()):
+            enemy.change_x = enemy_change_x
+            enemy.change_y = 0
+        self.grounded = grounded
+
+        # Enemies left far behind and well out of sight go dormant
+        margin = game.ENEMY_DEACTIVATION_MARGIN
+        out_of_sight = (x < view[0] - margin) | (y < view[1] - margin) | (x > view[2] + margin) | \
+            (y > view[3] + margin)
+        for index in np.flatnonzero((distance > game.ENEMY_DEACTIVATION_RADIUS) & out_of_sight).tolist():
+            self._sleep(self.enemies[index])
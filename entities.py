@@ -1,16 +1,13 @@
 import arcade
 import constants as game
+from animation import frame_table
+from components import entity_store, stored, stored_optional
+from tilegrid import TileGrid
 
-class Entity(arcade.Sprite):
-    """ Player Sprite """
-    def __init__(self, name_folder, name_file, ladder_list=None, hit_box_algorithm=None):
-        """ Init """
-        # parent initialize
-        super().__init__()
-
-        # Set our scale
-        self.scale = game.SPRITE_SCALING_PLAYER
 
+class CharacterTextures:
+    """ Animation frames for one character, shared by every sprite that uses it """
+    def __init__(self, name_folder, name_file):
         main_path = f":resources:images/animated_characters/{name_folder}/{name_file}"
 
         # Load textures for different actions
@@ -20,8 +17,62 @@ class Entity(arcade.Sprite):
         self.walk_textures = [arcade.load_texture_pair(f"{main_path}_walk{i}.png") for i in range(8)]
         self.climbing_textures = [arcade.load_texture(f"{main_path}_climb0.png"), arcade.load_texture(f"{main_path}_climb1.png")]
 
+
+# Loaded animation sets, keyed by (name_folder, name_file)
+_character_textures = {}
+
+
+def get_character_textures(name_folder, name_file):
+    """ Return the shared animation set for a character, loading it on first use """
+    key = (name_folder, name_file)
+    textures = _character_textures.get(key)
+    if textures is None:
+        textures = CharacterTextures(name_folder, name_file)
+        _character_textures[key] = textures
+    return textures
+
+
+def clear_character_textures():
+    """ Forget every loaded animation set so the next sprite loads its own again """
+    _character_textures.clear()
+
+
+class Entity(arcade.Sprite):
+    """ Player Sprite
+
+    Animation state lives in this entity's row of entity_store, the
+    attributes below only read and write that row.
+    """
+    __slots__ = ("row", "character_textures", "ladder_grid", "is_on_ladder", "_ladder_cells", "_touching_ladder",
+                 "_extents_scale", "_extents")
+
+    # Index of our current texture
+    cur_texture = stored("cur_texture")
+
+    # Facing, RIGHT_FACING or LEFT_FACING
+    character_face_direction = stored("face")
+
+    # How far have we traveled since changing the texture
+    x_odometer = stored("x_odometer")
+    y_odometer = stored("y_odometer")
+
+    def __init__(self, name_folder, name_file, ladder_grid=None, hit_box_algorithm=None):
+        """ Init """
+        # The row comes first, arcade's initializer already sets stored attributes like boundary_left
+        self.row = entity_store.allocate(self)
+
+        # parent initialize
+        super().__init__()
+
+        # Set our scale
+        self.scale = game.SPRITE_SCALING_PLAYER
+
+        # Textures for different actions, loaded once per character and shared
+        self.character_textures = get_character_textures(name_folder, name_file)
+
         # Set the initial texture
-        self.texture = self.idle_texture_pair[0]
+        self.texture = self.character_textures.idle_texture_pair[0]
+        frame_table.assign(self.row, self.character_textures)
 
         # Hit box will be set based on the first image used.
         self.hit_box = self.texture.hit_box_points
@@ -29,30 +80,45 @@ class Entity(arcade.Sprite):
         # Default to face-right
         self.character_face_direction = game.RIGHT_FACING
 
-        # Index of our current texture
-        self.cur_texture = 0
-
-        # How far have we traveled horizontally since changing the texture
-        self.x_odometer = 0
-        self.y_odometer = 0
-
         # Ladder related attributes
-        self.ladder_list = ladder_list
+        self.ladder_grid = ladder_grid  # TileGrid of the level's ladders
         self.is_on_ladder = False
 
-       
+        # Last ladder lookup, reused until the hit box crosses into other tiles
+        self._ladder_cells = None
+        self._touching_ladder = False
+
+        # Hit box extents around the center, cached for the scale they were computed at
+        self._extents_scale = None
+        self._extents = (0, 0, 0, 0)
+
+    def hit_box_extents(self):
+        """ (left, bottom, right, top) offsets of the scaled hit box from the center """
+        if self._extents_scale != self.scale:
+            points = self.get_hit_box()
+            xs = [x * self.scale for x, _ in points]
+            ys = [y * self.scale for _, y in points]
+            self._extents = (min(xs), min(ys), max(xs), max(ys))
+            self._extents_scale = self.scale
+        return self._extents
+
+    def is_touching_ladder(self):
+        """ Does the hit box overlap a ladder tile """
+        left, bottom, right, top = self.hit_box_extents()
+        cells = self.ladder_grid.cell_range(self.center_x + left, self.center_y + bottom,
+                                            self.center_x + right, self.center_y + top)
+        # Only look again once the sprite has moved into different tiles
+        if cells != self._ladder_cells:
+            self._ladder_cells = cells
+            self._touching_ladder = self.ladder_grid.any_in_range(*cells)
+        return self._touching_ladder
 
     def pymunk_moved(self, physics_engine, dx, dy, d_angle):
-        """ Handle being moved by the pymunk engine """
-        if dx < -game.DEAD_ZONE and self.character_face_direction == game.RIGHT_FACING:
-            self.character_face_direction = game.LEFT_FACING
-        elif dx > game.DEAD_ZONE and self.character_face_direction == game.LEFT_FACING:
-            self.character_face_direction = game.RIGHT_FACING
-
-    
-        is_on_ground = physics_engine.is_on_ground(self)
+        """ Handle being moved by the pymunk engine: climb without gravity while touching a ladder
 
-        if self.ladder_list and len(arcade.check_for_collision_with_list(self, self.ladder_list)) > 0:
+        The texture is picked afterwards by the level's AnimationSystem.
+        """
+        if self.ladder_grid is not None and self.is_touching_ladder():
             if not self.is_on_ladder:
                 self.is_on_ladder = True
                 self.pymunk.gravity = (0, 0)
@@ -65,168 +131,57 @@ class Entity(arcade.Sprite):
                 self.is_on_ladder = False
                 self.pymunk.gravity = None
 
-        #  odometer for how far we've moved
-        self.x_odometer += dx
-        self.y_odometer += dy
-
-        if self.is_on_ladder and not is_on_ground:
-            # Have we moved far enough to change the texture?
-            if abs(self.y_odometer) > game.DISTANCE_TO_CHANGE_TEXTURE:
-
-                # Reset the odometer
-                self.y_odometer = 0
-
-                # Advance the walking animation
-                self.cur_texture += 1
 
-            if self.cur_texture > 1:
-                self.cur_texture = 0
-            self.texture = self.climbing_textures[self.cur_texture]
-            return
-
-        # Jumping animation
-        if not is_on_ground:
-            if dy > game.DEAD_ZONE:
-                self.texture = self.jump_texture_pair[self.character_face_direction]
-                return
-            elif dy < -game.DEAD_ZONE:
-                self.texture = self.fall_texture_pair[self.character_face_direction]
-                return
+class Player(Entity):
+    """Player Sprite class."""
+    __slots__ = ("jump_count",)
 
-        # Idle animation
-        if abs(dx) <= game.DEAD_ZONE:
-            self.texture = self.idle_texture_pair[self.character_face_direction]
-            return
+    def __init__(self, ladder_grid: TileGrid, hit_box_algorithm):
+        super().__init__("male_person", "malePerson", ladder_grid, hit_box_algorithm)
 
-        if abs(self.x_odometer) > game.DISTANCE_TO_CHANGE_TEXTURE:
+        # Jumps since last on the ground, a second one in the air is allowed
+        self.jump_count = 0
 
-            # Reset the odometer
-            self.x_odometer = 0
 
-            # Advance the walking animation
-            self.cur_texture += 1
-            if self.cur_texture > 7:
-                self.cur_texture = 0
-            self.texture = self.walk_textures[self.cur_texture][self.character_face_direction]
 
-class Player(Entity):
-    """Player Sprite class."""
-    def __init__(self, ladder_list: arcade.SpriteList, hit_box_algorithm):
-        super().__init__("male_person", "malePerson", ladder_list, hit_box_algorithm)
-        
+class Enemy(Entity):
+    __slots__ = ("health", "default_damage", "attack_range", "attack_cooldown", "time_since_last_attack")
 
+    # Read as columns by EnemySystem
+    speed = stored("speed")
+    chase_range = stored("chase_range")
+    boundary_left = stored_optional("boundary_left")
+    boundary_right = stored_optional("boundary_right")
 
-class Enemy(Entity):
-    def __init__(self, name_folder, name_file, platform_list):
+    def __init__(self, name_folder, name_file):
         super().__init__(name_folder, name_file)
         self.speed = 100  # speed (adjust as needed)
         self.chase_range = 600  # chase range
-        self.boundary_left = None
-        self.boundary_right = None
         self.change_x = 0
         self.change_y = 0
         self.attack_range = 100  
         self.attack_cooldown = 1.0  
         self.time_since_last_attack = 0
-        self.animation_timer = 0  # Timer to control animation speed
-        self.platform_list = platform_list
 
     def take_damage(self, damage):
         self.health -= damage
         if self.health <= 0:
             self.kill()  # Remove the enemy from the game
 
-    
-    def is_ground_ahead(self):
-        """ Check if there is ground in front of the enemy """
-        direction = 1 if self.change_x > 0 else -1
-        front_x = self.center_x + (self.width / 2 * direction)
-        front_y = self.center_y - self.height / 2  
-
-        # Create a dummy sprite to check collision
-        check_sprite = arcade.Sprite()
-        check_sprite.center_x = front_x
-        check_sprite.center_y = front_y
-        check_sprite.width = 1  
-        check_sprite.height = self.height  
-
-        # Check if there's any platform under the new position
-        collisions = arcade.check_for_collision_with_list(check_sprite, self.platform_list)
-        return len(collisions) > 0
-
-    def update(self, delta_time, player_sprite, physics_engine, bullet_list):
-
-        # Chase the player if within range
-        dx = player_sprite.center_x - self.center_x
-        dy = player_sprite.center_y - self.center_y
-        distance = (dx**2 + dy**2)**0.5 
-
-        if distance < self.chase_range:
-            if distance != 0:
-                dx /= distance
-                dy /= distance
-            self.change_x = dx * self.speed
-            self.change_y = 0  # Enemies don't jump
-
-            if self.is_ground_ahead():
-                self.change_x = dx * self.speed
-            else:
-                self.change_x = 0  # Stop if there's no ground ahead
 
-        else:
-            self.change_x = 0
-            self.change_y = 0
-
-        # Apply velocity to the enemy using the physics engine
-        velocity = (self.change_x, self.change_y)
-        physics_engine.set_velocity(self, velocity)
-
-        # Check for boundaries and reverse direction if needed
-        if self.boundary_left is not None and self.center_x < self.boundary_left:
-            self.change_x *= -1
-        if self.boundary_right is not None and self.center_x > self.boundary_right:
-            self.change_x *= -1
-
-        # Check for collisions with projectiles
-        for bullet in bullet_list:
-            if arcade.check_for_collision(self, bullet):
-                self.take_damage(self.default_damage)  # Use default damage value
-                bullet.kill()  # Remove the bullet
-
-        # Update the enemy's animation
-        self.update_animation(delta_time)
-
-    def update_animation(self, delta_time):
-        # Figure out if we need to flip face left or right
-        if self.change_x < 0 and self.character_face_direction == game.RIGHT_FACING:
-            self.character_face_direction = game.RIGHT_FACING
-        elif self.change_x > 0 and self.character_face_direction == game.LEFT_FACING:
-            self.character_face_direction = game.LEFT_FACING
-
-        # Idle animation
-        if self.change_x == 0 and self.change_y == 0:
-            self.texture = self.idle_texture_pair[self.character_face_direction]
-            return
-        
-        # Walking animation
-        self.animation_timer += delta_time
-        if self.animation_timer > 0.1:  # Adjust this value to control animation speed
-            self.cur_texture += 1
-            if self.cur_texture > 7:
-                self.cur_texture = 0
-            self.texture = self.walk_textures[self.cur_texture][self.character_face_direction]
-            self.animation_timer = 0
-            
-    
 class RobotEnemy(Enemy):
-    def __init__(self, platform_list):
-        super().__init__("robot", "robot", platform_list)
+    __slots__ = ()
+
+    def __init__(self):
+        super().__init__("robot", "robot")
         self.health = 50
         self.default_damage = 10
                 
 class SuperRobot(RobotEnemy):
-    def __init__(self, platform_list):
-        super().__init__(platform_list)
+    __slots__ = ()
+
+    def __init__(self):
+        super().__init__()
         self.scale = 2.0  # Make the SuperRobot twice as big
         self.health = 1000  # Increase health to make it stronger
         self.default_damage = 30  # Increase damage to make it stronger
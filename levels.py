@@ -0,0 +1,554 @@
+"""
+Compiled level format.
+
+Tiled JSON maps store every tile layer as a full width * height array, most of it
+zeros. compile_level() turns a map into a small binary file that keeps only the
+occupied cells of each layer, the resolved tileset images, the tile objects and
+the cartesian cell of every point object. load_level() reads it back into a
+CompiledTileMap with the same sprite_lists / object_lists as arcade.load_tilemap,
+and falls back to the JSON map when the compiled file is missing or stale.
+
+A PreparedLevel adds what GameView builds the level's physics and enemy routes
+from: the platform and ladder grids, the merged wall shapes and the navigation
+graph. LevelPrefetcher works all of it out on a worker thread.
+
+Run "python levels.py" to recompile every map in assets/maps.
+"""
+import logging
+import math
+import os
+import pathlib
+import struct
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import arcade
+import numpy as np
+import pytiled_parser
+import pytiled_parser.tiled_object
+
+import constants as game
+from navigation import NavigationGraph
+from rendering import ChunkedSpriteLayer
+from tilegrid import TileGrid
+from walls import merge_hit_boxes
+
+# File header: magic, format version, crc32 of the source JSON
+LEVEL_MAGIC = b"RBLV"
+LEVEL_FORMAT_VERSION = 1
+LEVEL_EXTENSION = ".bin"
+
+_HEADER = struct.Struct("<4sHI")
+_MAP_INFO = struct.Struct("<HHHH")
+_TEXTURE = struct.Struct("<HHHHHB")
+_TILE = struct.Struct("<HHH")
+_TILE_OBJECT = struct.Struct("<Hfffff")
+_POINT_OBJECT = struct.Struct("<ffii")
+_LAYER_KIND = struct.Struct("<B")
+_LAYER_INFO = struct.Struct("<?f")
+_COUNT = struct.Struct("<I")
+
+# A _TILE record as a NumPy dtype, for reading a layer's tiles in one go
+_TILE_RECORD = np.dtype([("column", "<u2"), ("row", "<u2"), ("texture", "<u2")])
+
+# Layer kinds
+_TILE_LAYER = 0
+_OBJECT_LAYER = 1
+
+# Flags Tiled stores in the top bits of a GID
+_FLIPPED_HORIZONTALLY_FLAG = 0x80000000
+_FLIPPED_VERTICALLY_FLAG = 0x40000000
+_FLIPPED_DIAGONALLY_FLAG = 0x20000000
+_GID_MASK = 0x1FFFFFFF
+
+
+class _Writer:
+    """ Append-only binary buffer """
+    def __init__(self):
+        self.parts = []
+
+    def pack(self, fmt, *values):
+        self.parts.append(fmt.pack(*values))
+
+    def raw(self, data):
+        self.parts.append(data)
+
+    def string(self, value):
+        data = (value or "").encode("utf-8")
+        self.parts.append(struct.pack("<H", len(data)))
+        self.parts.append(data)
+
+    def properties(self, properties):
+        properties = properties or {}
+        self.parts.append(struct.pack("<H", len(properties)))
+        for name, value in properties.items():
+            self.string(name)
+            if isinstance(value, bool):
+                self.parts.append(struct.pack("<c?", b"b", value))
+            elif isinstance(value, int):
+                self.parts.append(struct.pack("<cq", b"i", value))
+            elif isinstance(value, float):
+                self.parts.append(struct.pack("<cd", b"f", value))
+            elif isinstance(value, str):
+                self.parts.append(b"s")
+                self.string(value)
+            else:
+                raise ValueError(f"Unsupported property type for '{name}': {type(value).__name__}")
+
+    def getvalue(self):
+        return b"".join(self.parts)
+
+
+class _Reader:
+    """ Sequential reader over a compiled level """
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.offset = 0
+
+    def unpack(self, fmt):
+        values = fmt.unpack_from(self.data, self.offset)
+        self.offset += fmt.size
+        return values
+
+    def raw(self, size):
+        """ The next size bytes, as a view into the data """
+        chunk = self.data[self.offset:self.offset + size]
+        self.offset += size
+        return chunk
+
+    def block(self, fmt, count):
+        """ Return a struct iterator over count consecutive records """
+        size = fmt.size * count
+        chunk = self.data[self.offset:self.offset + size]
+        self.offset += size
+        return fmt.iter_unpack(chunk)
+
+    def count(self, fmt="<H"):
+        value, = struct.unpack_from(fmt, self.data, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return value
+
+    def string(self):
+        length = self.count()
+        value = bytes(self.data[self.offset:self.offset + length]).decode("utf-8")
+        self.offset += length
+        return value
+
+    def properties(self):
+        properties = {}
+        for _ in range(self.count()):
+            name = self.string()
+            tag = bytes(self.data[self.offset:self.offset + 1])
+            self.offset += 1
+            if tag == b"b":
+                properties[name] = bool(self.count("<?"))
+            elif tag == b"i":
+                properties[name] = self.count("<q")
+            elif tag == b"f":
+                properties[name] = self.count("<d")
+            else:
+                properties[name] = self.string()
+        return properties
+
+
+def compiled_path(map_path):
+    """ Where the compiled form of a Tiled map lives """
+    return pathlib.Path(map_path).with_suffix(LEVEL_EXTENSION)
+
+
+def compile_level(map_path, output_path=None):
+    """ Compile a Tiled JSON map into the binary level format """
+    output_path = pathlib.Path(output_path) if output_path else compiled_path(map_path)
+    output_path.write_bytes(compile_level_data(map_path))
+    return output_path
+
+
+def compile_level_data(map_path):
+    """ Compile a Tiled JSON map and return the binary level in memory """
+    map_path = pathlib.Path(map_path).resolve()
+    source = map_path.read_bytes()
+    tiled_map = pytiled_parser.parse_map(map_path)
+    if tiled_map.infinite:
+        raise ValueError(f"Cannot compile infinite map {map_path}")
+
+    tilesets = sorted(tiled_map.tilesets.items(), reverse=True)
+    texture_index = {}
+    textures = _Writer()
+    layers = _Writer()
+
+    def texture_for(gid):
+        """ Resolve a GID to an entry in the texture table """
+        if gid in texture_index:
+            return texture_index[gid]
+        tile_gid = gid & _GID_MASK
+        for first_gid, tileset in tilesets:
+            if tile_gid >= first_gid:
+                break
+        else:
+            raise ValueError(f"Couldn't find tile for GID {tile_gid} in {map_path}")
+        if tileset.image is None:
+            raise ValueError(f"Tileset '{tileset.name}' has no image; only tile sheets can be compiled")
+        tile_id = tile_gid - first_gid
+        margin = tileset.margin or 0
+        spacing = tileset.spacing or 0
+        image_x = margin + (tile_id % tileset.columns) * (tileset.tile_width + spacing)
+        image_y = margin + (tile_id // tileset.columns) * (tileset.tile_height + spacing)
+        flags = ((gid & _FLIPPED_HORIZONTALLY_FLAG) and 1) \
+            | ((gid & _FLIPPED_VERTICALLY_FLAG) and 2) \
+            | ((gid & _FLIPPED_DIAGONALLY_FLAG) and 4)
+        image = pathlib.Path(map_path.parent, tileset.image)
+        textures.string(pathlib.Path(os.path.relpath(image, map_path.parent)).as_posix())
+        textures.pack(_TEXTURE, image_x, image_y, tileset.tile_width, tileset.tile_height, tile_id, flags)
+        texture_index[gid] = len(texture_index)
+        return texture_index[gid]
+
+    def compile_layers(layer_list):
+        count = 0
+        for layer in layer_list:
+            if isinstance(layer, pytiled_parser.LayerGroup):
+                count += compile_layers(layer.layers)
+                continue
+            if isinstance(layer, pytiled_parser.TileLayer):
+                layers.pack(_LAYER_KIND, _TILE_LAYER)
+            elif isinstance(layer, pytiled_parser.ObjectLayer):
+                layers.pack(_LAYER_KIND, _OBJECT_LAYER)
+            else:
+                raise ValueError(f"Unsupported layer type for '{layer.name}': {type(layer).__name__}")
+            layers.string(layer.name)
+            layers.pack(_LAYER_INFO, layer.visible, layer.opacity or 0)
+            layers.properties(layer.properties)
+            count += 1
+
+            if isinstance(layer, pytiled_parser.TileLayer):
+                # Sparse (column, row, texture) triples for the occupied cells only
+                tiles = [(column, row, texture_for(gid))
+                         for row, cells in enumerate(layer.data)
+                         for column, gid in enumerate(cells) if gid]
+                layers.pack(_COUNT, len(tiles))
+                layers.raw(b"".join(_TILE.pack(*tile) for tile in tiles))
+                continue
+
+            tile_objects = []
+            point_objects = []
+            for tiled_object in layer.tiled_objects:
+                if isinstance(tiled_object, pytiled_parser.tiled_object.Tile):
+                    tile_objects.append(tiled_object)
+                elif isinstance(tiled_object, pytiled_parser.tiled_object.Point):
+                    point_objects.append(tiled_object)
+                else:
+                    raise ValueError(f"Unsupported object {tiled_object.id} in layer '{layer.name}'")
+
+            layers.pack(_COUNT, len(tile_objects))
+            for tiled_object in tile_objects:
+                layers.pack(_TILE_OBJECT, texture_for(tiled_object.gid),
+                            tiled_object.coordinates.x, tiled_object.coordinates.y,
+                            tiled_object.size.width, tiled_object.size.height,
+                            tiled_object.rotation or 0)
+                layers.string(tiled_object.name)
+                layers.string(tiled_object.class_)
+                layers.properties(tiled_object.properties)
+
+            # Point objects keep their Tiled coordinates plus their precomputed cell
+            layers.pack(_COUNT, len(point_objects))
+            for tiled_object in point_objects:
+                layers.pack(_POINT_OBJECT,
+                            tiled_object.coordinates.x, tiled_object.coordinates.y,
+                            math.floor(tiled_object.coordinates.x / tiled_map.tile_size.width),
+                            math.floor((tiled_map.map_size.height * tiled_map.tile_size.height
+                                        - tiled_object.coordinates.y) / tiled_map.tile_size.height))
+                layers.string(tiled_object.name)
+                layers.string(tiled_object.class_)
+                layers.properties(tiled_object.properties)
+        return count
+
+    layer_count = compile_layers(tiled_map.layers)
+
+    output = _Writer()
+    output.pack(_HEADER, LEVEL_MAGIC, LEVEL_FORMAT_VERSION, zlib.crc32(source))
+    output.pack(_MAP_INFO, tiled_map.map_size.width, tiled_map.map_size.height,
+                tiled_map.tile_size.width, tiled_map.tile_size.height)
+    output.raw(struct.pack("<H", len(texture_index)))
+    output.raw(textures.getvalue())
+    output.raw(struct.pack("<H", layer_count))
+    output.raw(layers.getvalue())
+    return output.getvalue()
+
+
+class CompiledTileMap:
+    """ A level read from the compiled format, shaped like arcade.TileMap
+
+    With lazy=True only the sprites are created and sprite_lists stays empty
+    until create_sprite_lists() is called. Sprites and textures need no GL
+    context, so a lazy map can be read on a worker thread, and its
+    SpriteLists made there too if they are lazy as well.
+
+    Maps with more than STREAMING_MIN_CELLS cells are streamed: their tile
+    layers get no sprites, only records in tile_layers, and their SpriteLists
+    in sprite_lists stay empty. streaming.LevelStreamer makes the sprites of
+    the chunks around the player with tile_sprite().
+    """
+    def __init__(self, data, map_directory, scaling=1.0, lazy=False):
+        reader = _Reader(data)
+        magic, version, _crc = reader.unpack(_HEADER)
+        if magic != LEVEL_MAGIC or version != LEVEL_FORMAT_VERSION:
+            raise ValueError("Not a compiled level of this format version")
+
+        self.scaling = scaling
+        self.width, self.height, self.tile_width, self.tile_height = reader.unpack(_MAP_INFO)
+        self.streamed = self.width * self.height > game.STREAMING_MIN_CELLS
+        self.sprite_lists = OrderedDict()
+        self.object_lists = OrderedDict()
+        # Sprites per layer, waiting to be put in SpriteLists
+        self._sprite_layers = OrderedDict()
+        # Cartesian cell of each object in object_lists, computed at compile time
+        self.object_cells = OrderedDict()
+        # (tile records, visible, alpha, properties) of each tile layer of a streamed map
+        self.tile_layers = OrderedDict()
+        # Tile records of every tile layer, rows counted down from the top of the map
+        self.tile_records = OrderedDict()
+
+        self.textures = textures = []
+        for _ in range(reader.count()):
+            file_name = pathlib.Path(map_directory, reader.string()).resolve()
+            image_x, image_y, width, height, tile_id, flags = reader.unpack(_TEXTURE)
+            texture = arcade.load_texture(file_name, image_x, image_y, width, height,
+                                          flipped_horizontally=bool(flags & 1),
+                                          flipped_vertically=bool(flags & 2),
+                                          flipped_diagonally=bool(flags & 4),
+                                          hit_box_algorithm="Simple")
+            textures.append((texture, tile_id))
+
+        for _ in range(reader.count()):
+            kind, = reader.unpack(_LAYER_KIND)
+            name = reader.string()
+            visible, opacity = reader.unpack(_LAYER_INFO)
+            properties = reader.properties()
+            alpha = int(opacity * 255) if opacity else None
+            if kind == _TILE_LAYER:
+                self._read_tile_layer(reader, name, visible, alpha, properties, textures)
+            else:
+                self._read_object_layer(reader, name, visible, alpha, textures)
+
+        if not lazy:
+            self.create_sprite_lists()
+
+    def create_sprite_lists(self, lazy=False):
+        """ Put the sprites of every layer into SpriteLists, lazy ones get their GL buffers when first drawn """
+        for name, (sprites, visible, properties) in self._sprite_layers.items():
+            sprite_list = arcade.SpriteList(lazy=lazy)
+            if sprites or name in self.tile_layers:
+                sprite_list.visible = visible
+                if properties:
+                    sprite_list.properties = properties
+                sprite_list.extend(sprites)
+            self.sprite_lists[name] = sprite_list
+        self._sprite_layers.clear()
+
+    def _read_tile_layer(self, reader, name, visible, alpha, properties, textures):
+        count = reader.count("<I")
+        records = np.frombuffer(reader.raw(_TILE.size * count), dtype=_TILE_RECORD)
+        self.tile_records[name] = records
+        if self.streamed:
+            self.tile_layers[name] = (records, visible, alpha, properties)
+            self._sprite_layers[name] = ([], visible, properties)
+            return
+        sprites = [self.tile_sprite(texture_id, column, row, alpha)
+                   for column, row, texture_id in records.tolist()]
+        self._sprite_layers[name] = (sprites, visible, properties)
+
+    def tile_sprite(self, texture_id, column, row, alpha=None):
+        """ The sprite for a tile, at its column and its row counted down from the top of the map """
+        texture, tile_id = self.textures[texture_id]
+        sprite = arcade.Sprite(texture=texture, scale=self.scaling)
+        sprite.center_x = column * (self.tile_width * self.scaling) + sprite.width / 2
+        sprite.center_y = (self.height - row - 1) * (self.tile_height * self.scaling) + sprite.height / 2
+        sprite.properties["tile_id"] = tile_id
+        if alpha is not None:
+            sprite.alpha = alpha
+        return sprite
+
+    def tile_cells(self, layer_name):
+        """ Cartesian (columns, rows) arrays of the cells a tile layer fills """
+        records = self.tile_records[layer_name]
+        return records["column"].astype(np.intp), self.height - 1 - records["row"].astype(np.intp)
+
+    def _read_object_layer(self, reader, name, visible, alpha, textures):
+        sprites = []
+        map_height = self.height * self.tile_height
+        for _ in range(reader.count("<I")):
+            texture_id, x, y, width, height, rotation = reader.unpack(_TILE_OBJECT)
+            object_name = reader.string()
+            object_class = reader.string()
+            properties = reader.properties()
+            texture, tile_id = textures[texture_id]
+            sprite = arcade.Sprite(texture=texture, scale=self.scaling)
+            sprite.properties["tile_id"] = tile_id
+            sprite.width = width = width * self.scaling
+            sprite.height = height = height * self.scaling
+            angle = math.degrees(-math.radians(rotation)) if rotation else 0
+            center_x, center_y = arcade.rotate_point(width / 2, height / 2, 0, 0, angle)
+            sprite.position = (x * self.scaling + center_x, (map_height - y) * self.scaling + center_y)
+            sprite.angle = angle
+            if alpha is not None:
+                sprite.alpha = alpha
+            for attribute in ("change_x", "change_y", "boundary_bottom", "boundary_top",
+                              "boundary_left", "boundary_right"):
+                if attribute in properties:
+                    setattr(sprite, attribute, float(properties[attribute]))
+            sprite.properties.update(properties)
+            if object_class:
+                sprite.properties["type"] = object_class
+            if object_name:
+                sprite.properties["name"] = object_name
+            sprites.append(sprite)
+        if sprites:
+            self._sprite_layers[name] = (sprites, visible, None)
+
+        object_list = []
+        cells = []
+        for _ in range(reader.count("<I")):
+            x, y, cell_x, cell_y = reader.unpack(_POINT_OBJECT)
+            object_name = reader.string()
+            object_class = reader.string()
+            properties = reader.properties()
+            shape = [x * self.scaling, (map_height - y) * self.scaling]
+            object_list.append(arcade.TiledObject(shape, properties or None, object_name, object_class))
+            cells.append((cell_x, cell_y))
+        if object_list:
+            self.object_lists[name] = object_list
+            self.object_cells[name] = cells
+
+    def get_cartesian(self, x, y):
+        """ Given pixel coordinates, return the tile cell they fall in """
+        x = math.floor(x / (self.tile_width * self.scaling))
+        y = math.floor(y / (self.tile_height * self.scaling))
+        return x, y
+
+
+def read_compiled_level(map_path, scaling=1.0, lazy=False):
+    """ Load the compiled form of a map, or None if it is missing or out of date """
+    level_path = compiled_path(map_path)
+    try:
+        data = level_path.read_bytes()
+        source_crc = zlib.crc32(pathlib.Path(map_path).read_bytes())
+    except OSError:
+        return None
+    if len(data) < _HEADER.size:
+        return None
+    magic, version, crc = _HEADER.unpack_from(data)
+    if magic != LEVEL_MAGIC or version != LEVEL_FORMAT_VERSION or crc != source_crc:
+        return None
+    return CompiledTileMap(data, level_path.parent, scaling, lazy)
+
+
+def load_level(map_path, scaling=1.0):
+    """ Load a level, preferring its compiled form over the Tiled JSON """
+    tile_map = read_compiled_level(map_path, scaling)
+    if tile_map is None:
+        tile_map = arcade.load_tilemap(map_path, scaling)
+    return tile_map
+
+
+# Tile layers that never move, drawn by chunk
+STATIC_LAYERS = ("Background", "Platforms", "Ladders", "Goal")
+
+
+class PreparedLevel:
+    """ A level's tile map, with the data GameView builds the level from worked out
+
+    platform_grid and ladder_grid mark the cells of the Platforms and Ladders
+    layers. walls holds the merged (rectangles, polygons) covering the
+    Platforms hit boxes, or None for a streamed map, whose walls come with
+    its chunks. navigation is the enemies' NavigationGraph, and
+    static_layers the ChunkedSpriteLayer of each layer in STATIC_LAYERS.
+    With lazy SpriteLists none of this touches GL, so it can all be done on
+    a worker thread.
+    """
+    def __init__(self, tile_map):
+        self.tile_map = tile_map
+        self.platform_grid = TileGrid.from_tile_map(tile_map, "Platforms")
+        self.ladder_grid = TileGrid.from_tile_map(tile_map, "Ladders")
+        self.walls = None
+        if not getattr(tile_map, "streamed", False):
+            self.walls = merge_hit_boxes(tile_map.sprite_lists["Platforms"])
+        self.navigation = NavigationGraph(self.platform_grid, self.ladder_grid)
+
+        chunk_size = game.RENDER_CHUNK_TILES * tile_map.tile_width * tile_map.scaling
+        self.static_layers = {name: ChunkedSpriteLayer(tile_map.sprite_lists[name], chunk_size)
+                              for name in STATIC_LAYERS}
+
+
+class LevelPrefetcher:
+    """ Prepares upcoming levels on a worker thread
+
+    The worker reads (or compiles) the level into lazy SpriteLists and
+    works out its grids, wall shapes, navigation graph and chunks. The
+    level's GL resources are created on the main thread when it is first
+    drawn.
+    """
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="level-prefetch")
+        self._pending = {}
+
+    def prefetch(self, map_path, scaling=1.0):
+        """ Start preparing a level in the background, returning its future """
+        key = (str(map_path), scaling)
+        if key not in self._pending:
+            self._pending[key] = self._executor.submit(prepare_level, map_path, scaling)
+        return self._pending[key]
+
+    def take(self, map_path, scaling=1.0):
+        """ Return the prefetched PreparedLevel ready to use, or None if it was never requested """
+        future = self._pending.pop((str(map_path), scaling), None)
+        if future is None:
+            return None
+        try:
+            return future.result()
+        except Exception as e:
+            logging.warning(f"Prefetching {map_path} failed, loading it directly: {e}")
+            return None
+
+    def shutdown(self, wait=False):
+        """ Drop pending work and stop the worker thread, optionally waiting for it """
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=wait)
+
+
+def prepare_level(map_path, scaling=1.0):
+    """ Read and prepare a level without touching GL, for a worker thread """
+    tile_map = read_compiled_level(map_path, scaling, lazy=True)
+    if tile_map is None:
+        # Stale or missing compiled level, compile it in memory instead
+        data = compile_level_data(map_path)
+        tile_map = CompiledTileMap(data, pathlib.Path(map_path).resolve().parent, scaling, lazy=True)
+    tile_map.create_sprite_lists(lazy=True)
+    return PreparedLevel(tile_map)
+
+
+def level_map_path(level, maps_path=None):
+    """ Path of the Tiled map for a level number, in maps_path or else the game's maps """
+    return pathlib.Path(maps_path or game.ASSETS_PATH / "maps") / f"level_{level}.json"
+
+
+def get_object_cells(tile_map, layer_name):
+    """ Return (cartesian cell, object) pairs for an object layer """
+    objects = tile_map.object_lists.get(layer_name, [])
+    if isinstance(tile_map, CompiledTileMap):
+        cells = tile_map.object_cells.get(layer_name, [])
+    else:
+        cells = [tile_map.get_cartesian(my_object.shape[0], my_object.shape[1]) for my_object in objects]
+    return list(zip(cells, objects))
+
+
+def main():
+    """ Compile every Tiled map under assets/maps """
+    for map_path in sorted((game.ASSETS_PATH / "maps").glob("*.json")):
+        output_path = compile_level(map_path)
+        print(f"{map_path.name}: {map_path.stat().st_size} -> {output_path.stat().st_size} bytes")
+
+
+if __name__ == "__main__":
+    main()
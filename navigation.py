@@ -0,0 +1,203 @@
+"""Routes for enemies through a level's tile grid
+
+NavigationGraph turns the Platforms and Ladders grids into cells an enemy
+can stand or climb in, joined by walk, drop, jump and ladder moves. A
+FlowField holds the next move towards the player from every one of those
+cells, so any number of enemies look up their route with one array index.
+The field is only rebuilt when the player moves to another cell.
+"""
+import math
+from collections import deque
+import numpy as np
+import constants as game
+
+# Moves stored in a flow field. ARRIVED marks the target cell itself
+NONE, WALK_LEFT, WALK_RIGHT, JUMP_LEFT, JUMP_RIGHT, CLIMB_UP, CLIMB_DOWN, ARRIVED = range(8)
+
+# Horizontal and climbing direction of each move, indexed by move
+MOVE_DIRECTION = np.array([0, -1, 1, -1, 1, 0, 0, 0])
+MOVE_CLIMB = np.array([0, 0, 0, 0, 0, 1, -1, 0])
+
+
+class NavigationGraph:
+    """ Cells an enemy can be in, and the moves between them
+
+    A cell is a node when an enemy can stand in it (the cell below is a
+    platform and there is headroom for its body), when it holds a ladder, or
+    when it is the clear cell on top of a ladder. Enemies hold their height
+    in ladder and ladder top cells instead of falling. Enemies walk to a
+    neighbouring node, drop off a ledge to the first node below the next
+    column, jump up to jump_cells onto the next column, and climb up and
+    down ladders. With leap_cells, they also jump gaps up to that many cells
+    wide to a node level with the one they jump from. Edges are stored
+    reversed, which is the direction the flow field search follows them.
+    """
+    def __init__(self, platform_grid, ladder_grid, headroom=game.NAV_HEADROOM_CELLS, jump_cells=game.NAV_JUMP_CELLS,
+                 leap_cells=0):
+        self.columns = platform_grid.columns
+        self.rows = platform_grid.rows
+        self.cell_width = platform_grid.cell_width
+        self.cell_height = platform_grid.cell_height
+        self.platform_grid = platform_grid
+        self.ladder_grid = ladder_grid
+        self.headroom = headroom
+
+        standing, holds = self._node_cells()
+        self.nodes = bytearray((standing | holds).astype(np.uint8).tobytes())
+        self.holds = holds.ravel()
+
+        # For each node, the (node, move, cells jumped) that lead into it
+        self.incoming = [[] for _ in range(self.columns * self.rows)]
+        for index in np.flatnonzero(self.nodes).tolist():
+            self._add_moves_from(index % self.columns, index // self.columns, jump_cells, leap_cells)
+
+    def _node_cells(self):
+        """ Cells an enemy can stand in, and ladder cells that hold it up, as arrays by row and column """
+        rows, columns = self.rows, self.columns
+        solid = np.frombuffer(self.platform_grid.cells, dtype=np.uint8).reshape(rows, columns) != 0
+
+        # Solid cells with a border the way is_solid() sees it: solid below the map and at its
+        # sides, clear above it. Cell (column, row) is at [row + 1, column + 1]
+        bordered = np.ones((rows + 1 + self.headroom, columns + 2), dtype=bool)
+        bordered[1:, 1:-1] = False
+        bordered[1:rows + 1, 1:-1] = solid
+
+        clear = np.ones((rows, columns), dtype=bool)
+        for height in range(self.headroom):
+            clear &= ~bordered[1 + height:rows + 1 + height, 1:-1]
+        standing = clear & bordered[:rows, 1:-1]
+
+        if self.ladder_grid is None:
+            ladder = np.zeros((rows, columns), dtype=bool)
+        else:
+            ladder = ~solid & (np.frombuffer(self.ladder_grid.cells, dtype=np.uint8).reshape(rows, columns) != 0)
+        ladder_below = np.zeros((rows, columns), dtype=bool)
+        ladder_below[1:] = ladder[:-1]
+        holds = ~standing & (ladder | (clear & ladder_below))
+        return standing, holds
+
+    def is_solid(self, column, row):
+        """ Platform cells, with the sides and bottom of the map counted as solid """
+        if column < 0 or column >= self.columns or row < 0:
+            return True
+        return self.platform_grid.is_solid(column, row)
+
+    def is_ladder(self, column, row):
+        return not self.is_solid(column, row) and self.ladder_grid is not None and \
+            self.ladder_grid.is_solid(column, row)
+
+    def is_clear(self, column, row):
+        """ Is there room for an enemy's body with its feet in this cell """
+        return not any(self.is_solid(column, row + height) for height in range(self.headroom))
+
+    def is_standing(self, column, row):
+        return self.is_clear(column, row) and self.is_solid(column, row - 1)
+
+    def is_node(self, column, row):
+        if 0 <= column < self.columns and 0 <= row < self.rows:
+            return self.nodes[row * self.columns + column] != 0
+        return False
+
+    def _add_move(self, column, row, to_column, to_row, move, jumped=0):
+        self.incoming[to_row * self.columns + to_column].append((row * self.columns + column, move, jumped))
+
+    def _add_moves_from(self, column, row, jump_cells, leap_cells=0):
+        for direction, walk, jump in ((-1, WALK_LEFT, JUMP_LEFT), (1, WALK_RIGHT, JUMP_RIGHT)):
+            side = column + direction
+            if self.is_node(side, row):
+                self._add_move(column, row, side, row, walk)
+            elif self.is_clear(side, row):
+                # Walk off the ledge and fall to the first node below
+                for below in range(row - 1, -1, -1):
+                    if self.is_node(side, below):
+                        self._add_move(column, row, side, below, walk)
+                        break
+                    if self.is_solid(side, below):
+                        break
+
+            if self.is_standing(column, row):
+                # Jump onto a higher node in the next column while there is room overhead
+                for height in range(1, jump_cells + 1):
+                    if self.is_solid(column, row + self.headroom + height - 1):
+                        break
+                    if self.is_standing(side, row + height):
+                        self._add_move(column, row, side, row + height, jump, height)
+
+                # Leap a gap to the first node level with this one, while there is room over the gap
+                if not self.is_node(side, row) and self.is_clear(side, row):
+                    for distance in range(1, leap_cells + 1):
+                        across = side + direction * distance
+                        if not self.is_clear(across, row):
+                            break
+                        if self.is_standing(across, row):
+                            self._add_move(column, row, across, row, jump)
+                            break
+
+        if self.is_ladder(column, row):
+            if self.is_node(column, row + 1):
+                self._add_move(column, row, column, row + 1, CLIMB_UP)
+            if self.is_node(column, row - 1):
+                self._add_move(column, row, column, row - 1, CLIMB_DOWN)
+
+    def cell_at(self, x, y):
+        """ The (column, row) a point falls in """
+        return math.floor(x / self.cell_width), math.floor(y / self.cell_height)
+
+    def landing_cell(self, x, y):
+        """ The node a body with its feet at this point is in, or will land in, or None """
+        column, row = self.cell_at(x, y)
+        if not 0 <= column < self.columns:
+            return None
+        if self.is_solid(column, row) and self.is_node(column, row + 1):
+            # Feet sunk a little into the floor
+            return column, row + 1
+        for below in range(min(row, self.rows - 1), -1, -1):
+            if self.is_node(column, below):
+                return column, below
+            if self.is_solid(column, below):
+                return None
+        return None
+
+
+class FlowField:
+    """ The next move towards a target cell from every node of a NavigationGraph
+
+    move and jump are flat arrays indexed by row * columns + column. Cells
+    that can't reach the target hold NONE.
+    """
+    def __init__(self, graph):
+        self.graph = graph
+        self.target = None
+        self.move = np.zeros(graph.columns * graph.rows, dtype=np.int8)
+        self.jump = np.zeros(graph.columns * graph.rows, dtype=np.int8)
+
+    def retarget(self, x, y):
+        """ Point the field at the node under a position, rebuilding it only if that node changed """
+        target = self.graph.landing_cell(x, y)
+        if target is None or target == self.target:
+            return False
+        self.target = target
+        self._build()
+        return True
+
+    def _build(self):
+        """ Breadth first search back along the moves from the target """
+        graph = self.graph
+        move = [NONE] * (graph.columns * graph.rows)
+        jump = [0] * len(move)
+        column, row = self.target
+        start = row * graph.columns + column
+        move[start] = ARRIVED
+
+        queue = deque([start])
+        incoming = graph.incoming
+        while queue:
+            index = queue.popleft()
+            for source, source_move, jumped in incoming[index]:
+                if move[source] == NONE:
+                    move[source] = source_move
+                    jump[source] = jumped
+                    queue.append(source)
+
+        self.move = np.array(move, dtype=np.int8)
+        self.jump = np.array(jump, dtype=np.int8)
@@ -0,0 +1,508 @@
+"""Automated playtesting with bots, across every core
+
+Each run plays one level headless, the way simulation.py does, driven by a
+bot instead of a script. Runs are spread over a pool of processes and their
+results are combined into a report: how often each level is completed, how
+long it takes, where players die or get stuck, how often they leave the
+level altogether, and what a fixed step costs.
+
+    python playtest.py --runs 500 --ticks 7200 --output playtest_report.json
+
+Bots use the same controls as a player, queued per tick through
+GameView.queue_input(). A run is repeatable from its level, policy and seed.
+With --record-playthrough the goal bot plays the whole game once and its
+input is saved as the recording benchmarks.py replays.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import arcade
+import constants as game
+from navigation import ARRIVED, CLIMB_DOWN, CLIMB_UP, JUMP_LEFT, JUMP_RIGHT, MOVE_CLIMB, MOVE_DIRECTION, NONE, \
+    FlowField, NavigationGraph
+from replay import InputRecording, session_result
+from simulation import HeadlessRunner, run_right_script
+
+# Width of the buckets step times are counted in, in milliseconds
+TICK_COST_BUCKET_MS = 0.05
+
+# Cells listed for each level in the report's death and stuck locations
+REPORT_HOTSPOTS = 5
+
+# Ticks between a random bot's choices of direction
+BOT_DECISION_TICKS = (20, 60)
+
+# Chance of a random bot jumping on any tick it isn't stuck
+BOT_JUMP_CHANCE = 0.02
+
+# Ticks without moving before a random bot jumps, and before it turns round
+BOT_STUCK_TICKS = 20
+BOT_TURN_TICKS = 120
+
+# How far bots shoot at enemies, and the ticks between their shots
+BOT_SHOOT_RANGE = 500
+BOT_SHOOT_INTERVAL = 10
+
+# A goal bot stops for enemies this close on its level, backs away from them
+# closer than BOT_ENEMY_RETREAT, and counts them on its level within BOT_ENEMY_HEIGHT
+BOT_ENEMY_WAIT = 350
+BOT_ENEMY_RETREAT = 200
+BOT_ENEMY_HEIGHT = 100
+
+# Highest step and widest gap in cells a goal bot plans to clear with a double jump
+BOT_JUMP_CELLS = 4
+BOT_LEAP_CELLS = 12
+
+# Gap in pixels a goal bot leaves between itself and a moving platform it waits beside
+BOT_LIFT_GAP = 4
+
+# Highest a descending platform's top can be above a goal bot's feet for it to jump on
+BOT_LIFT_REACH = 130
+
+# A goal bot leaves a platform this many pixels below the top of its travel, plus
+# up to BOT_LIFT_JITTER more picked by the seed
+BOT_LIFT_LEAVE = 20
+BOT_LIFT_JITTER = 40
+
+# How close in pixels a goal bot gets to where it is heading before it lets go
+BOT_POSITION_TOLERANCE = 6
+
+# Seconds of its speed a goal bot allows for sliding to a stop on the ground
+BOT_BRAKE_TIME = 0.15
+
+
+def runner_bot(seed, ticks):
+    """ Hold right and jump at a steady rhythm, the rhythm picked by the seed """
+    return run_right_script(ticks, jump_every=random.Random(seed).randint(30, 60))
+
+
+class RandomBot:
+    """ Explores with every control, mostly heading right towards the goal
+
+    Every so often it picks a direction to hold. It jumps now and then and
+    whenever it stops making progress, turns round when stuck for long,
+    climbs the ladders it is on and shoots the nearest awake enemy in range.
+    """
+    def __init__(self, seed, ticks):
+        self.random = random.Random(seed)
+        self.held = set()
+        self.next_decision = 0
+        self.direction = arcade.key.D
+        self.last_x = None
+        self.still_ticks = 0
+        self.next_shot = 0
+
+    def apply(self, tick, view):
+        """ Queue this tick's input on the view, like ScriptedInput """
+        player = view.player_sprite
+        if tick >= self.next_decision:
+            self.next_decision = tick + self.random.randint(*BOT_DECISION_TICKS)
+            roll = self.random.random()
+            self.direction = arcade.key.D if roll < 0.7 else arcade.key.A if roll < 0.85 else None
+
+        # Progress, measured while trying to move
+        if self.last_x is not None and self.direction is not None and abs(player.center_x - self.last_x) < 1:
+            self.still_ticks += 1
+        else:
+            self.still_ticks = 0
+        self.last_x = player.center_x
+        if self.still_ticks >= BOT_TURN_TICKS:
+            self.direction = arcade.key.A if self.direction == arcade.key.D else arcade.key.D
+            self.still_ticks = 0
+
+        wanted = {self.direction} if self.direction is not None else set()
+        if player.is_on_ladder:
+            wanted.add(arcade.key.W)
+        for key in self.held - wanted:
+            view.queue_input(("release", key))
+        for key in wanted - self.held:
+            view.queue_input(("press", key))
+        self.held = wanted
+
+        if self.still_ticks == BOT_STUCK_TICKS or self.random.random() < BOT_JUMP_CHANCE:
+            view.queue_input(("press", arcade.key.SPACE))
+            view.queue_input(("release", arcade.key.SPACE))
+
+        if tick >= self.next_shot:
+            target = nearest_enemy(view, BOT_SHOOT_RANGE)
+            if target is not None:
+                view.queue_input(("shoot", target.center_x, target.center_y))
+                self.next_shot = tick + BOT_SHOOT_INTERVAL
+
+
+class GoalBot:
+    """ Heads for the level's goal, the way enemies head for the player
+
+    It follows a FlowField over a NavigationGraph made with the player's
+    double jump. Where the field has no route, like at the foot of a cliff,
+    it rides the nearest moving platform that goes up and down and jumps off
+    towards the goal near the top. It jumps whatever it is stuck against,
+    like a crate, holds back from enemies on its level and shoots the
+    nearest awake one in range. The seed picks how high it leaves platforms.
+    """
+    def __init__(self, seed, ticks):
+        self.lift_leave = BOT_LIFT_LEAVE + random.Random(seed).randint(0, BOT_LIFT_JITTER)
+        self.held = set()
+        self.level = None
+        self.double_jump = False
+        self.leaving_lift = False
+        self.last_x = None
+        self.still_ticks = 0
+        self.next_shot = 0
+
+    def _plan(self, view):
+        """ Point a flow field at the goal of the level the view is on """
+        self.level = view.level
+        self.graph = NavigationGraph(view.platform_grid, view.ladder_grid, jump_cells=BOT_JUMP_CELLS,
+                                     leap_cells=BOT_LEAP_CELLS)
+        self.field = FlowField(self.graph)
+        self.goal = view.goal_list[0] if view.goal_list else None
+        if self.goal is not None:
+            self.field.retarget(self.goal.center_x, self.goal.center_y)
+        self.lifts = [platform for platform in view.moving_sprites_list
+                      if platform.change_y and platform.boundary_bottom and platform.boundary_top]
+
+    def _move(self, player):
+        """ The field's move and the column it is in from under the player's feet """
+        graph = self.graph
+        row = math.floor((player.bottom + 1) / graph.cell_height)
+        for offset in (0.0, -0.25, 0.25):
+            column = math.floor((player.center_x + player.width * offset) / graph.cell_width)
+            if 0 <= column < graph.columns and 0 <= row < graph.rows:
+                index = row * graph.columns + column
+                move = int(self.field.move[index])
+                if move != NONE:
+                    return move, column
+        return NONE, None
+
+    def apply(self, tick, view):
+        """ Queue this tick's input on the view, like ScriptedInput """
+        if view.level != self.level:
+            self._plan(view)
+        player = view.player_sprite
+        engine = view.physics_engine
+        body = engine.get_physics_object(player).body
+        on_ground = engine.is_on_ground(player)
+        goal_direction = 1 if self.goal is None or self.goal.center_x >= player.center_x else -1
+        if on_ground:
+            self.leaving_lift = False
+
+        # Stuck against something while trying to walk
+        if self.last_x is not None and self.held & {arcade.key.A, arcade.key.D} and \
+                abs(player.center_x - self.last_x) < 1:
+            self.still_ticks += 1
+        else:
+            self.still_ticks = 0
+        self.last_x = player.center_x
+
+        move, column = self._move(player)
+        direction = None
+        climb = 0
+        jump = False
+        if move == ARRIVED or self.leaving_lift:
+            direction = goal_direction
+        elif move != NONE:
+            direction = int(MOVE_DIRECTION[move]) or None
+            climb = int(MOVE_CLIMB[move])
+            if move in (CLIMB_UP, CLIMB_DOWN):
+                # Keep to the middle of the ladder
+                direction = self._steer((column + 0.5) * self.graph.cell_width, player, body.velocity.x, on_ground)
+            if move in (JUMP_LEFT, JUMP_RIGHT) and on_ground:
+                jump = True
+                self.double_jump = True
+        elif self.lifts:
+            lift = min(self.lifts, key=lambda platform: abs(platform.center_x - player.center_x))
+            direction, jump = self._ride(player, body.velocity.x, lift, on_ground, goal_direction)
+        else:
+            direction = goal_direction if on_ground else self._held_direction()
+
+        # Hold back from enemies on the same level while shooting them
+        threat = nearest_enemy(view, BOT_ENEMY_WAIT)
+        if threat is not None and on_ground and abs(threat.center_y - player.center_y) < BOT_ENEMY_HEIGHT:
+            away = 1 if player.center_x > threat.center_x else -1
+            if abs(threat.center_x - player.center_x) < BOT_ENEMY_RETREAT:
+                direction = away
+            elif direction == -away:
+                direction = None
+            jump = False
+            climb = 0
+
+        if on_ground and self.still_ticks >= BOT_STUCK_TICKS:
+            jump = True
+            self.double_jump = True
+            self.still_ticks = 0
+
+        wanted = set()
+        if direction is not None:
+            wanted.add(arcade.key.D if direction > 0 else arcade.key.A)
+        if climb:
+            wanted.add(arcade.key.W if climb > 0 else arcade.key.S)
+        for key in self.held - wanted:
+            view.queue_input(("release", key))
+        for key in wanted - self.held:
+            view.queue_input(("press", key))
+        self.held = wanted
+
+        # The second jump goes at the top of the first
+        if not jump and self.double_jump and not on_ground and body.velocity.y <= 0:
+            jump = True
+            self.double_jump = False
+        if jump:
+            view.queue_input(("press", arcade.key.SPACE))
+            view.queue_input(("release", arcade.key.SPACE))
+
+        if tick >= self.next_shot:
+            target = nearest_enemy(view, BOT_SHOOT_RANGE)
+            if target is not None:
+                view.queue_input(("shoot", target.center_x, target.center_y))
+                self.next_shot = tick + BOT_SHOOT_INTERVAL
+
+    def _held_direction(self):
+        if arcade.key.D in self.held:
+            return 1
+        if arcade.key.A in self.held:
+            return -1
+        return None
+
+    def _steer(self, target_x, player, velocity_x, on_ground):
+        """ The direction to hold to come to a stop at target_x, or None to let go
+
+        Where the player would stop is judged from its speed, sliding on the
+        ground or slowed by the in-air force in the air.
+        """
+        if on_ground:
+            stop_x = player.center_x + velocity_x * BOT_BRAKE_TIME
+        else:
+            stop_x = player.center_x + velocity_x * abs(velocity_x) * game.PLAYER_MASS / \
+                (2 * game.PLAYER_MOVE_FORCE_IN_AIR)
+        if abs(target_x - stop_x) < BOT_POSITION_TOLERANCE:
+            return None
+        return 1 if target_x > stop_x else -1
+
+    def _ride(self, player, velocity_x, lift, on_ground, goal_direction):
+        """ The direction to hold and whether to jump, to board a platform, ride it up and jump off
+
+        It waits beside the platform for it to come down, jumps straight up
+        past its side and only steers over it once above it.
+        """
+        reach = (lift.width + player.width) / 2
+        if on_ground and abs(lift.center_x - player.center_x) < reach and abs(player.bottom - lift.top) < 8:
+            # Riding, jump off towards the goal near the top
+            if lift.change_y > 0 and lift.top > lift.boundary_top - self.lift_leave:
+                self.double_jump = True
+                self.leaving_lift = True
+                return goal_direction, True
+            return self._steer(lift.center_x, player, velocity_x, True), False
+        if not on_ground:
+            if player.bottom > lift.top:
+                return self._steer(lift.center_x, player, velocity_x, False), False
+            return None, False
+
+        side = 1 if player.center_x > lift.center_x else -1
+        direction = self._steer(lift.center_x + side * (reach + BOT_LIFT_GAP), player, velocity_x, True)
+        if direction is None and lift.change_y < 0 and lift.top < player.bottom + BOT_LIFT_REACH:
+            self.double_jump = True
+            return None, True
+        return direction, False
+
+
+def nearest_enemy(view, reach):
+    """ The closest awake enemy to the player within reach, or None """
+    player_x, player_y = view.player_sprite.position
+    best = None
+    best_distance = reach
+    for enemy in view.enemy_system.active_list:
+        distance = math.hypot(enemy.center_x - player_x, enemy.center_y - player_y)
+        if distance < best_distance:
+            best = enemy
+            best_distance = distance
+    return best
+
+
+# Bot policies by name, each called with (seed, ticks) for an object with apply(tick, view)
+POLICIES = {
+    "runner": runner_bot,
+    "random": RandomBot,
+    "goal": GoalBot,
+}
+
+
+def play(level, policy, seed, ticks):
+    """ Play one level with a bot until it is completed, the player dies or leaves the level, or ticks run out """
+    runner = HeadlessRunner(level, POLICIES[policy](seed, ticks))
+    view = runner.view
+    grid = view.platform_grid
+    outcome = "stuck"
+    cell = None
+    tick_costs = {}
+    try:
+        while runner.tick < ticks:
+            start = time.perf_counter()
+            runner.step()
+            elapsed = time.perf_counter() - start
+            if view.level != level or view.outcome == "won":
+                # Left out of the step times, the step loaded the next level
+                outcome = "completed"
+                break
+            bucket = int(elapsed * 1000 / TICK_COST_BUCKET_MS)
+            tick_costs[bucket] = tick_costs.get(bucket, 0) + 1
+
+            # The map clamp lets the player walk off past the level's edges, or drop under its floor
+            cell = grid.cell_at(*view.player_sprite.position)
+            if not (0 <= cell[0] < grid.columns and 0 <= cell[1] < grid.rows) or grid.is_solid(*cell):
+                outcome = "fell out"
+                break
+            if view.outcome == "game over":
+                outcome = "died"
+                break
+    finally:
+        runner.close()
+    return {"level": level, "policy": policy, "seed": seed, "outcome": outcome, "ticks": runner.tick,
+            "cell": cell, "tick_costs": tick_costs}
+
+
+def record_playthrough(path, seed, ticks):
+    """ Play the whole game from level 1 with the goal bot, saving its input as a recording
+
+    benchmarks.py replays the recording, so its playthrough stays the same
+    input whatever later happens to the bot. Returns the recording.
+    """
+    bot = GoalBot(seed, ticks)
+    runner = HeadlessRunner(1)
+    view = runner.view
+    recording = InputRecording(1)
+    try:
+        while runner.tick < ticks and view.outcome is None:
+            bot.apply(runner.tick, view)
+            recording.events += [(runner.tick, *event) for event in view.pending_input]
+            runner.step()
+    finally:
+        runner.close()
+    recording.result = session_result(view)
+    recording.save(path)
+    return recording
+
+
+def _play(job):
+    return play(*job)
+
+
+def bucket_percentile(counts, fraction):
+    """ Nearest-rank percentile in milliseconds of step times counted in buckets """
+    total = sum(counts.values())
+    rank = max(1, math.ceil(fraction * total))
+    seen = 0
+    for bucket in sorted(counts):
+        seen += counts[bucket]
+        if seen >= rank:
+            return round((bucket + 0.5) * TICK_COST_BUCKET_MS, 3)
+    return 0.0
+
+
+def hotspots(cells):
+    """ The most common cells, most common first, as [column, row, count] """
+    counts = {}
+    for cell in cells:
+        counts[cell] = counts.get(cell, 0) + 1
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:REPORT_HOTSPOTS]
+    return [[column, row, count] for (column, row), count in ranked]
+
+
+def build_report(results, seconds, workers):
+    """ Combine run results into per level and policy figures """
+    groups = {}
+    for result in results:
+        groups.setdefault((result["level"], result["policy"]), []).append(result)
+
+    report = {"runs": len(results), "workers": workers, "seconds": round(seconds, 2),
+              "ticks": sum(result["ticks"] for result in results), "levels": []}
+    report["ticks_per_second"] = round(report["ticks"] / seconds) if seconds else None
+    for (level, policy), runs in sorted(groups.items()):
+        completed = sorted(run["ticks"] * game.FIXED_DELTA_TIME for run in runs if run["outcome"] == "completed")
+        tick_costs = {}
+        for run in runs:
+            for bucket, count in run["tick_costs"].items():
+                tick_costs[bucket] = tick_costs.get(bucket, 0) + count
+        report["levels"].append({
+            "level": level,
+            "policy": policy,
+            "runs": len(runs),
+            "completion_rate": round(len(completed) / len(runs), 3),
+            "died": sum(run["outcome"] == "died" for run in runs),
+            "stuck": sum(run["outcome"] == "stuck" for run in runs),
+            "fell_out": sum(run["outcome"] == "fell out" for run in runs),
+            "time_to_goal": {
+                "median": round(completed[len(completed) // 2], 2),
+                "mean": round(sum(completed) / len(completed), 2),
+                "fastest": round(completed[0], 2),
+            } if completed else None,
+            "death_cells": hotspots(tuple(run["cell"]) for run in runs if run["outcome"] == "died"),
+            "stuck_cells": hotspots(tuple(run["cell"]) for run in runs if run["outcome"] == "stuck"),
+            "tick_cost_ms": {
+                "p50": bucket_percentile(tick_costs, 0.50),
+                "p95": bucket_percentile(tick_costs, 0.95),
+                "p99": bucket_percentile(tick_costs, 0.99),
+            },
+        })
+    return report
+
+
+def print_report(report):
+    print(f"{report['runs']} runs, {report['ticks']} ticks in {report['seconds']} s on {report['workers']} "
+          f"processes, {report['ticks_per_second']} ticks/s")
+    for entry in report["levels"]:
+        time_to_goal = entry["time_to_goal"]
+        goal_text = f"median {time_to_goal['median']} s to goal" if time_to_goal else "never reached the goal"
+        print(f"level {entry['level']} {entry['policy']}: {entry['completion_rate']:.0%} completed, "
+              f"{entry['died']} died, {entry['stuck']} stuck, {entry['fell_out']} fell out of the level, {goal_text}, "
+              f"step p50 {entry['tick_cost_ms']['p50']} ms p95 {entry['tick_cost_ms']['p95']} ms")
+        for label, cells in (("deaths", entry["death_cells"]), ("stuck", entry["stuck_cells"])):
+            if cells:
+                print(f"  {label} at " + ", ".join(f"({column}, {row}) x{count}" for column, row, count in cells))
+
+
+def main():
+    """ Run the playtests and report on them """
+    parser = argparse.ArgumentParser(description="Playtest the levels with bots on every core")
+    parser.add_argument("--levels", type=int, nargs="+", default=list(range(1, game.LEVEL_COUNT + 1)),
+                        help="levels to play")
+    parser.add_argument("--policies", nargs="+", choices=sorted(POLICIES), default=sorted(POLICIES),
+                        help="bot policies to play with")
+    parser.add_argument("--runs", type=int, default=100, help="runs of each level with each policy")
+    parser.add_argument("--ticks", type=int, default=3600, help="fixed steps before a run counts as stuck")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first run, later runs count up from it")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes to run on")
+    parser.add_argument("--output", default="playtest_report.json", help="where to write the JSON report")
+    parser.add_argument("--record-playthrough", metavar="PATH",
+                        help="instead, record the goal bot playing the whole game, with --ticks for each level")
+    args = parser.parse_args()
+
+    if args.record_playthrough:
+        recording = record_playthrough(args.record_playthrough, args.seed, args.ticks * game.LEVEL_COUNT)
+        result = recording.result
+        print(f"Recorded {len(recording.events)} input events over {result['ticks']} ticks, "
+              f"level {result['level']}, outcome: {result['outcome'] or 'running'}")
+        if result["outcome"] != "won":
+            sys.exit(1)
+        return
+
+    jobs = [(level, policy, args.seed + run, args.ticks)
+            for level in args.levels for policy in args.policies for run in range(args.runs)]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        results = list(executor.map(_play, jobs, chunksize=max(1, len(jobs) // (args.workers * 8))))
+    report = build_report(results, time.perf_counter() - start, args.workers)
+
+    print_report(report)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
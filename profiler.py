@@ -0,0 +1,159 @@
+"""Per-phase frame timing
+
+GameView marks the end of each phase of on_update and on_draw on a
+FrameProfiler. The profiler keeps a rolling window of per-frame phase times,
+tracks the worst frame, and can record every frame to a CSV or JSON trace.
+F3 in game toggles the overlay and F4 starts and stops a trace.
+"""
+import csv
+import json
+import time
+from collections import deque
+import arcade
+import constants as game
+
+
+class FrameProfiler:
+    """ Times the phases of each frame
+
+    start() begins timing, mark(phase) charges the time since the previous
+    start() or mark() to a phase, and end_frame() closes the frame. Phases
+    marked more than once in a frame, like those run every fixed step, add
+    up. While disabled every call returns straight away.
+    """
+    def __init__(self, enabled=False, window_size=game.PROFILER_WINDOW):
+        self.enabled = enabled
+        self.window_size = window_size
+
+        # Phase names in the order they were first seen
+        self.phases = []
+
+        # Seconds per frame for each phase, and for whole frames, over the rolling window
+        self.history = {}
+        self.frame_totals = deque(maxlen=window_size)
+
+        # Phase times of the frame in progress
+        self.current = {}
+        self.last = 0.0
+
+        self.frame_count = 0
+        self.worst_total = 0.0
+        self.worst_frame = {}
+        self.worst_frame_number = None
+
+        # Every frame's phase times while a trace is being recorded
+        self.trace = None
+
+    def start(self):
+        """ Begin timing from now without charging the time before to any phase """
+        if self.enabled:
+            self.last = time.perf_counter()
+
+    def mark(self, phase):
+        """ Charge the time since the last start() or mark() to a phase """
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.current[phase] = self.current.get(phase, 0.0) + now - self.last
+        self.last = now
+
+    def end_frame(self):
+        """ Add the finished frame to the rolling window, the worst frame and the trace """
+        if not self.enabled:
+            return
+        frame = self.current
+        self.current = {}
+        for phase in frame:
+            if phase not in self.history:
+                self.phases.append(phase)
+                self.history[phase] = deque(maxlen=self.window_size)
+        for phase in self.phases:
+            self.history[phase].append(frame.get(phase, 0.0))
+
+        total = sum(frame.values())
+        self.frame_totals.append(total)
+        self.frame_count += 1
+        if total > self.worst_total:
+            self.worst_total = total
+            self.worst_frame = frame
+            self.worst_frame_number = self.frame_count
+
+        if self.trace is not None:
+            self.trace.append(frame)
+
+    def averages(self):
+        """ Rolling average milliseconds per frame of every phase """
+        return {phase: sum(times) * 1000 / len(times) for phase, times in self.history.items()}
+
+    def summary(self):
+        """ Rolling averages and worst frames, in milliseconds """
+        frame_totals = self.frame_totals
+        return {
+            "frames": self.frame_count,
+            "average_frame": sum(frame_totals) * 1000 / len(frame_totals) if frame_totals else 0.0,
+            "worst_recent_frame": max(frame_totals) * 1000 if frame_totals else 0.0,
+            "worst_frame": self.worst_total * 1000,
+            "worst_frame_number": self.worst_frame_number,
+            "worst_frame_phases": {phase: seconds * 1000 for phase, seconds in self.worst_frame.items()},
+            "phase_averages": self.averages(),
+        }
+
+    def start_trace(self):
+        """ Record every frame from now on """
+        self.trace = []
+
+    def stop_trace(self, path):
+        """ Stop recording and write the trace, as CSV or as JSON if path ends in .json """
+        frames = self.trace or []
+        self.trace = None
+        path = str(path)
+        if path.endswith(".json"):
+            with open(path, "w") as file:
+                json.dump({
+                    "summary": self.summary(),
+                    "frames": [{phase: seconds * 1000 for phase, seconds in frame.items()} for frame in frames],
+                }, file, indent=2)
+        else:
+            with open(path, "w", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow(["frame", "total_ms"] + [f"{phase}_ms" for phase in self.phases])
+                for number, frame in enumerate(frames, 1):
+                    writer.writerow([number, round(sum(frame.values()) * 1000, 4)] +
+                                    [round(frame.get(phase, 0.0) * 1000, 4) for phase in self.phases])
+        return len(frames)
+
+
+class ProfilerOverlay:
+    """ Panel in the top left corner of the screen with the profiler's numbers
+
+    The text is rebuilt a few times a second rather than every frame.
+    """
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.text = arcade.Text("", 10, game.SCREEN_HEIGHT - 10, arcade.color.WHITE, 12,
+                                width=320, multiline=True, anchor_y="top", font_name="Courier New")
+        self.refresh_timer = 0.0
+
+    def update(self, delta_time):
+        """ Refresh the text when it is due """
+        self.refresh_timer -= delta_time
+        if self.refresh_timer > 0:
+            return
+        self.refresh_timer = game.PROFILER_OVERLAY_REFRESH
+
+        summary = self.profiler.summary()
+        lines = [
+            f"frame   {summary['average_frame']:6.2f} ms avg",
+            f"worst   {summary['worst_recent_frame']:6.2f} ms recent, {summary['worst_frame']:.2f} ms ever",
+        ]
+        lines += [f"{phase:<11}{average:6.2f} ms" for phase, average in summary["phase_averages"].items()]
+        if self.profiler.trace is not None:
+            lines.append(f"tracing {len(self.profiler.trace)} frames")
+        self.text.text = "\n".join(lines)
+
+    def draw(self):
+        """ Draw the panel in screen coordinates """
+        arcade.draw_lrtb_rectangle_filled(0, self.text.content_width + 20,
+                                          game.SCREEN_HEIGHT, game.SCREEN_HEIGHT - self.text.content_height - 20,
+                                          (0, 0, 0, 160))
+        self.text.draw()
@@ -0,0 +1,270 @@
+import math
+import arcade
+
+
+def visible_rect(camera, margin=0):
+    """ (left, bottom, right, top) of the world area a camera shows, grown by margin """
+    left, bottom = camera.position
+    return (left - margin,
+            bottom - margin,
+            left + camera.viewport_width * camera.scale + margin,
+            bottom + camera.viewport_height * camera.scale + margin)
+
+
+class ChunkedSpriteLayer:
+    """ A static sprite layer split into square chunks
+
+    Every chunk is its own SpriteList, and only chunks that overlap the
+    visible rectangle are drawn, so the cost of drawing a layer follows the
+    screen size rather than the map size. The sprites must not move after
+    the layer is built. Chunks are lazy SpriteLists, so a layer can be split
+    up away from the GL thread.
+    """
+    def __init__(self, sprite_list, chunk_size):
+        self.chunk_size = chunk_size
+        self.visible = sprite_list.visible
+
+        # SpriteList per (chunk column, chunk row)
+        self.chunks = {}
+
+        # How far a sprite reaches outside the chunk its center is in
+        self.overhang = 0
+
+        for sprite in sprite_list:
+            key = (math.floor(sprite.center_x / chunk_size), math.floor(sprite.center_y / chunk_size))
+            chunk = self.chunks.get(key)
+            if chunk is None:
+                chunk = arcade.SpriteList(lazy=True)
+                self.chunks[key] = chunk
+            chunk.append(sprite)
+            self.overhang = max(self.overhang, sprite.width / 2, sprite.height / 2)
+
+    def set_chunk(self, key, sprite_list):
+        """ Draw a SpriteList as the chunk at (chunk column, chunk row), for layers filled in as they stream """
+        self.chunks[key] = sprite_list
+        for sprite in sprite_list:
+            self.overhang = max(self.overhang, sprite.width / 2, sprite.height / 2)
+
+    def remove_chunk(self, key):
+        self.chunks.pop(key, None)
+
+    def chunks_in_rect(self, left, bottom, right, top):
+        """ The chunk SpriteLists overlapping a rectangle """
+        first_column = math.floor((left - self.overhang) / self.chunk_size)
+        last_column = math.floor((right + self.overhang) / self.chunk_size)
+        first_row = math.floor((bottom - self.overhang) / self.chunk_size)
+        last_row = math.floor((top + self.overhang) / self.chunk_size)
+        for row in range(first_row, last_row + 1):
+            for column in range(first_column, last_column + 1):
+                chunk = self.chunks.get((column, row))
+                if chunk is not None:
+                    yield chunk
+
+    def draw(self, left, bottom, right, top):
+        """ Draw the chunks overlapping the visible rectangle """
+        if not self.visible:
+            return
+        for chunk in self.chunks_in_rect(left, bottom, right, top):
+            chunk.draw()
+
+
+_BAKED_VERTEX_SHADER = """
+#version 330
+
+uniform Projection {
+    uniform mat4 matrix;
+} proj;
+
+in vec2 in_vert;
+in vec2 in_uv;
+out vec2 v_uv;
+
+void main() {
+    gl_Position = proj.matrix * vec4(in_vert, 0.0, 1.0);
+    v_uv = in_uv;
+}
+"""
+
+_BAKED_FRAGMENT_SHADER = """
+#version 330
+
+uniform sampler2D layer_texture;
+in vec2 v_uv;
+out vec4 f_color;
+
+void main() {
+    f_color = texture(layer_texture, v_uv);
+}
+"""
+
+# Draws a quad given in normalized device coordinates, covering the whole viewport
+_FROZEN_VERTEX_SHADER = """
+#version 330
+
+in vec2 in_vert;
+in vec2 in_uv;
+out vec2 v_uv;
+
+void main() {
+    gl_Position = vec4(in_vert, 0.0, 1.0);
+    v_uv = in_uv;
+}
+"""
+
+
+# Programs that draw baked chunks, compiled once per context
+_baked_programs = {}
+
+
+def _baked_program(ctx):
+    """ The program BakedSpriteLayer draws its chunks with on a context """
+    program = _baked_programs.get(ctx)
+    if program is None:
+        program = ctx.program(vertex_shader=_BAKED_VERTEX_SHADER, fragment_shader=_BAKED_FRAGMENT_SHADER)
+        program["layer_texture"] = 0
+        _baked_programs[ctx] = program
+    return program
+
+
+class BakedSpriteLayer:
+    """ A static chunked layer rendered once into offscreen textures
+
+    bake() renders every chunk some sprite reaches into into its own
+    framebuffer texture, and draws bake the layer first if it wasn't. After
+    that each visible chunk is a single textured quad, no matter how many
+    sprites it holds. Baked colors are premultiplied by alpha and drawn with
+    matching blending; the alpha of partly transparent pixels is
+    approximate, which is fine for opaque tiles. release() frees the
+    textures of a layer that isn't on show.
+    """
+    def __init__(self, layer):
+        self.layer = layer
+        self.chunk_size = layer.chunk_size
+        self.visible = layer.visible
+
+        # (texture, quad geometry) per chunk, filled in by bake()
+        self.baked = None
+        self.program = None
+
+    def _chunk_keys(self):
+        """ Every chunk some sprite's texture reaches into """
+        keys = set()
+        size = self.chunk_size
+        for chunk in self.layer.chunks.values():
+            for sprite in chunk:
+                half_width, half_height = sprite.width / 2, sprite.height / 2
+                for column in range(math.floor((sprite.center_x - half_width) / size),
+                                    math.floor((sprite.center_x + half_width) / size) + 1):
+                    for row in range(math.floor((sprite.center_y - half_height) / size),
+                                     math.floor((sprite.center_y + half_height) / size) + 1):
+                        keys.add((column, row))
+        return keys
+
+    def bake(self):
+        """ Render every chunk into its own texture """
+        ctx = arcade.get_window().ctx
+        self.program = _baked_program(ctx)
+
+        size = self.chunk_size
+        pixels = math.ceil(size)
+        projection = ctx.projection_2d_matrix
+        self.baked = {}
+        for column, row in self._chunk_keys():
+            left, bottom = column * size, row * size
+            texture = ctx.texture((pixels, pixels), components=4,
+                                  wrap_x=arcade.gl.CLAMP_TO_EDGE, wrap_y=arcade.gl.CLAMP_TO_EDGE)
+            framebuffer = ctx.framebuffer(color_attachments=[texture])
+            with framebuffer.activate():
+                framebuffer.clear()
+                ctx.projection_2d = (left, left + pixels, bottom, bottom + pixels)
+                for chunk in self.layer.chunks_in_rect(left, bottom, left + pixels, bottom + pixels):
+                    chunk.draw()
+            framebuffer.delete()
+            quad = arcade.gl.geometry.quad_2d(size=(pixels, pixels),
+                                              pos=(left + pixels / 2, bottom + pixels / 2))
+            self.baked[(column, row)] = (texture, quad)
+        ctx.projection_2d_matrix = projection
+
+    def release(self):
+        """ Free the baked textures, the layer is baked again before it is next drawn """
+        if self.baked is not None:
+            for texture, _quad in self.baked.values():
+                texture.delete()
+            self.baked = None
+
+    def draw(self, left, bottom, right, top):
+        """ Draw the baked chunks overlapping the visible rectangle """
+        if not self.visible:
+            return
+        if self.baked is None:
+            self.bake()
+
+        ctx = self.program.ctx
+        ctx.blend_func = arcade.gl.ONE, arcade.gl.ONE_MINUS_SRC_ALPHA
+        size = self.chunk_size
+        for row in range(math.floor(bottom / size), math.floor(top / size) + 1):
+            for column in range(math.floor(left / size), math.floor(right / size) + 1):
+                baked = self.baked.get((column, row))
+                if baked is not None:
+                    texture, quad = baked
+                    texture.use(0)
+                    quad.render(self.program)
+        ctx.blend_func = ctx.BLEND_DEFAULT
+
+
+# (program, quad) that draw frozen frames, compiled once per context
+_frozen_programs = {}
+
+
+def _frozen_program(ctx):
+    """ The program and full screen quad FrozenFrame draws with on a context """
+    cached = _frozen_programs.get(ctx)
+    if cached is None:
+        program = ctx.program(vertex_shader=_FROZEN_VERTEX_SHADER, fragment_shader=_BAKED_FRAGMENT_SHADER)
+        program["layer_texture"] = 0
+        cached = program, arcade.gl.geometry.quad_2d_fs()
+        _frozen_programs[ctx] = cached
+    return cached
+
+
+class FrozenFrame:
+    """ One frame drawn to the screen, kept in a texture and drawn again as a single quad
+
+    For screens shown over a world that isn't changing, like a paused or
+    finished game. draw_frame is called once, on the screen cleared to the
+    window's background color. Anything drawn over the frame on every
+    screen, like a dimming rectangle, belongs in draw_frame too.
+
+    The texture is the size of the window's framebuffer in real pixels, so
+    it matches the screen on HiDPI displays too, and copying the screen into
+    it resolves the screen's multisampling. A frame no longer needed, or
+    captured at a size the window no longer has, should be released.
+    """
+    def __init__(self, draw_frame):
+        window = arcade.get_window()
+        self.ctx = window.ctx
+        self.size = window.get_framebuffer_size()
+        self.texture = self.ctx.texture(self.size, components=4)
+        self.framebuffer = self.ctx.framebuffer(color_attachments=[self.texture])
+        self.program, self.quad = _frozen_program(self.ctx)
+
+        self.ctx.screen.use()
+        window.clear()
+        draw_frame()
+        self.ctx.copy_framebuffer(self.ctx.screen, self.framebuffer)
+
+    def draw(self):
+        """ Cover the screen with the frozen frame """
+        screen = self.ctx.screen
+        screen.use()
+        viewport = screen.viewport
+        screen.viewport = (0, 0, *self.size)
+        with self.ctx.enabled_only():
+            self.texture.use(0)
+            self.quad.render(self.program)
+        screen.viewport = viewport
+
+    def release(self):
+        """ Free the frame's texture and framebuffer """
+        self.framebuffer.delete()
+        self.texture.delete()
@@ -0,0 +1,82 @@
+"""Recorded input, for replaying a play session exactly
+
+GameView queues key and mouse input and applies it at the start of the
+next fixed step, so the same input on the same ticks always plays out the
+same way. An InputRecorder logs that input per tick from the start of a
+level, and the recording also keeps how the session ended. Feeding the
+events back through a headless GameView repeats the session, which makes
+real play sessions usable as benchmarks and shows whether a change altered
+the gameplay:
+
+    python simulation.py --replay input_recording.json
+"""
+import json
+import constants as game
+
+
+class InputRecording:
+    """ A level, the input events of a session on it, and the session's result
+
+    Events are (tick, "press", key), (tick, "release", key) or
+    (tick, "shoot", x, y) with x and y in map coordinates.
+    """
+    def __init__(self, level, events=None, result=None):
+        self.level = level
+        self.events = events if events is not None else []
+        self.result = result
+
+    def save(self, path):
+        with open(path, "w") as file:
+            json.dump({
+                "level": self.level,
+                "fixed_delta_time": game.FIXED_DELTA_TIME,
+                "events": self.events,
+                "result": self.result,
+            }, file, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as file:
+            data = json.load(file)
+        if data.get("fixed_delta_time") != game.FIXED_DELTA_TIME:
+            raise ValueError(f"{path} was recorded with a fixed step of {data.get('fixed_delta_time')}, "
+                             f"not {game.FIXED_DELTA_TIME}")
+        return cls(data["level"], [tuple(event) for event in data["events"]], data["result"])
+
+
+def session_result(view):
+    """ Where a session stands, to compare a replay against """
+    return {
+        "ticks": view.tick,
+        "outcome": view.outcome,
+        "level": view.level,
+        "score": view.score,
+        "player": list(view.player_sprite.position),
+    }
+
+
+def compare_results(recorded, replayed):
+    """ The ways a replay ended differently from the recording, empty if it matched """
+    differences = []
+    for key in ("ticks", "outcome", "level", "score"):
+        if recorded[key] != replayed[key]:
+            differences.append(f"{key}: recorded {recorded[key]}, replayed {replayed[key]}")
+    drift = max(abs(a - b) for a, b in zip(recorded["player"], replayed["player"]))
+    if drift > game.REPLAY_POSITION_TOLERANCE:
+        differences.append(f"player: recorded {recorded['player']}, replayed {replayed['player']}")
+    return differences
+
+
+class InputRecorder:
+    """ Logs the input GameView applies on each tick, from the start of a level """
+    def __init__(self, level):
+        self.recording = InputRecording(level)
+
+    def record(self, tick, event):
+        self.recording.events.append((tick, *event))
+
+    def save(self, view, path=game.INPUT_RECORDING_PATH):
+        """ Write the events so far and the session's current result """
+        self.recording.result = session_result(view)
+        self.recording.save(path)
+        return len(self.recording.events)
@@ -0,0 +1,167 @@
+"""Run the game logic without a window
+
+HeadlessRunner builds a GameView in headless mode, loads a level through the
+normal setup() path and calls fixed_update() at the fixed step, feeding it
+scripted input. Nothing is drawn and no sound is played, so this runs on a
+machine with no display and measures pure simulation speed:
+
+    python simulation.py --level 2 --ticks 3600
+
+With --replay it plays back a recorded session instead and checks that it
+ends the way it did when it was recorded. With --check-restart it climbs a
+ladder, restarts the level and checks it then plays the same as a fresh load.
+"""
+import argparse
+import math
+import sys
+import time
+import arcade
+import constants as game
+from replay import InputRecording, compare_results, session_result
+from views import GameView
+
+
+class ScriptedInput:
+    """ Input events keyed by the tick they happen on
+
+    Events are (tick, "press", key), (tick, "release", key) or
+    (tick, "shoot", x, y) with x and y in map coordinates.
+    """
+    def __init__(self, events=()):
+        self.events = {}
+        for tick, *event in events:
+            self.events.setdefault(tick, []).append(event)
+
+    def apply(self, tick, view):
+        """ Queue the events for one tick on the view, the way live input is """
+        for event in self.events.get(tick, ()):
+            view.queue_input(tuple(event))
+
+
+def run_right_script(ticks, jump_every=45):
+    """ Hold right the whole run and jump at a steady rhythm """
+    events = [(0, "press", arcade.key.D)]
+    for tick in range(jump_every, ticks, jump_every):
+        events.append((tick, "press", arcade.key.SPACE))
+        events.append((tick + 1, "release", arcade.key.SPACE))
+    return ScriptedInput(events)
+
+
+class HeadlessRunner:
+    """ Steps a headless GameView one fixed tick at a time """
+    def __init__(self, level=1, script=None, maps_path=None):
+        self.view = GameView(headless=True, maps_path=maps_path)
+        self.view.level = level
+        self.view.setup()
+        self.script = script if script is not None else ScriptedInput()
+        self.tick = 0
+
+    def step(self):
+        """ Apply this tick's input and simulate one fixed step """
+        self.script.apply(self.tick, self.view)
+        self.view.fixed_update(game.FIXED_DELTA_TIME)
+        self.tick += 1
+
+    def run(self, ticks):
+        """ Step until ticks have run or the game ends, returning ticks per second """
+        ran = 0
+        start = time.perf_counter()
+        while ran < ticks and self.view.outcome is None:
+            self.step()
+            ran += 1
+        elapsed = time.perf_counter() - start
+        return ran / elapsed if elapsed else float("inf")
+
+    def close(self):
+        """ Stop the view's background level loading """
+        self.view.level_prefetcher.shutdown()
+
+
+def replay(recording):
+    """ Play a recording back headless, returning the runner and its ticks per second """
+    runner = HeadlessRunner(recording.level, ScriptedInput(recording.events))
+    try:
+        rate = runner.run(recording.result["ticks"])
+    finally:
+        runner.close()
+    return runner, rate
+
+
+def check_restart(level, ticks):
+    """ Restart a level from on a ladder and play it against a fresh load
+
+    Returns the largest distance in pixels between the two players over the
+    run, or None when the player could not be put on a ladder.
+    """
+    fresh = HeadlessRunner(level, run_right_script(ticks))
+    restarted = HeadlessRunner(level)
+    try:
+        view = restarted.view
+        player = view.player_sprite
+        for ladder in view.ladder_list:
+            view.physics_engine.set_position(player, ladder.position)
+            player.position = ladder.position
+            view.fixed_update(game.FIXED_DELTA_TIME)
+            if player.is_on_ladder:
+                break
+        else:
+            return None
+        view.restart()
+        restarted.script = run_right_script(ticks)
+
+        drift = 0.0
+        while fresh.tick < ticks and fresh.view.outcome is None:
+            fresh.step()
+            restarted.step()
+            drift = max(drift, math.dist(fresh.view.player_sprite.position, player.position))
+        return drift
+    finally:
+        fresh.close()
+        restarted.close()
+
+
+def main():
+    """ Time a headless run of one level """
+    parser = argparse.ArgumentParser(description="Run the game logic without a window")
+    parser.add_argument("--level", type=int, default=1, help="level to start on")
+    parser.add_argument("--ticks", type=int, default=3600, help="fixed steps to simulate")
+    parser.add_argument("--replay", help="input recording to play back and check")
+    parser.add_argument("--check-restart", action="store_true",
+                        help="check a restart from on a ladder plays like a fresh load of the level")
+    args = parser.parse_args()
+
+    if args.check_restart:
+        drift = check_restart(args.level, args.ticks)
+        if drift is None:
+            print(f"level {args.level} has no ladder the player can be put on")
+            return
+        matches = drift <= game.REPLAY_POSITION_TOLERANCE
+        print(f"restarted level {args.level} {'matches' if matches else 'differs from'} a fresh load, "
+              f"players up to {drift:.2f} px apart")
+        if not matches:
+            sys.exit(1)
+        return
+
+    if args.replay:
+        recording = InputRecording.load(args.replay)
+        runner, rate = replay(recording)
+        differences = compare_results(recording.result, session_result(runner.view))
+        print(f"{runner.tick} ticks, {rate:.0f} ticks/s, "
+              f"{'matches the recording' if not differences else 'differs from the recording'}")
+        for difference in differences:
+            print(f"  {difference}")
+        if differences:
+            sys.exit(1)
+        return
+
+    runner = HeadlessRunner(args.level, run_right_script(args.ticks))
+    try:
+        rate = runner.run(args.ticks)
+    finally:
+        runner.close()
+    view = runner.view
+    print(f"{runner.tick} ticks, {rate:.0f} ticks/s, level {view.level}, outcome: {view.outcome or 'running'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Restarting a level in place
+
+A LevelSnapshot is taken right after GameView.setup() builds a level. It
+keeps the level's sprite lists, physics engine and systems, plus the state
+play changes: every physics body's position and velocity, which sprites are
+in which lists, and per-sprite state like health, animation frame, ladder
+physics and moving platform direction. Restoring it puts all of that back,
+reusing the same sprites, bodies and shapes, so a restart takes
+milliseconds instead of a full level load. The textures of the level's baked
+layers are freed while the run is on other levels, and GameView.restart()
+renders them again.
+"""
+from components import entity_store
+
+# GameView attributes that make up a level, put back as they were on restore
+VIEW_ATTRIBUTES = (
+    "level", "map_width", "map_height", "score",
+    "player_sprite", "player_list", "wall_list", "bullet_list", "item_list", "moving_sprites_list",
+    "ladder_list", "enemy_list", "goal_list", "background_list",
+    "background_layer", "wall_layer", "ladder_layer", "goal_layer",
+    "platform_grid", "ladder_grid", "physics_engine", "bullet_pool", "enemy_system", "level_streamer",
+)
+
+# Sprite lists whose contents play can change
+SPRITE_LISTS = ("player_list", "item_list", "enemy_list", "moving_sprites_list")
+
+# Sprite attributes changed by play, saved for the sprites that have them. Entities keep the
+# rest of their state in entity_store, which is saved row by row
+SPRITE_ATTRIBUTES = ("texture", "change_x", "change_y", "health", "jump_count", "time_since_last_attack",
+                     "is_on_ladder", "_ladder_cells", "_touching_ladder")
+
+# Per-sprite physics settings, changed while an entity climbs a ladder
+PYMUNK_ATTRIBUTES = ("gravity", "damping", "max_velocity", "max_horizontal_velocity", "max_vertical_velocity")
+
+
+class LevelSnapshot:
+    """ A level as GameView.setup() left it, to restart it without loading it again """
+    def __init__(self, view):
+        self.view_state = {name: getattr(view, name) for name in VIEW_ATTRIBUTES}
+        self.sprite_lists = {name: list(getattr(view, name)) for name in SPRITE_LISTS}
+
+        engine = view.physics_engine
+        self.physics_objects = dict(engine.sprites)
+        self.non_static_sprites = list(engine.non_static_sprite_list)
+        self.bodies = [(physics_object.body, physics_object.body.position, physics_object.body.velocity,
+                        physics_object.body.angle, physics_object.body.angular_velocity)
+                       for physics_object in self.physics_objects.values()]
+
+        self.sprite_state = []
+        for sprite in self.physics_objects:
+            attributes = {name: getattr(sprite, name) for name in SPRITE_ATTRIBUTES if hasattr(sprite, name)}
+            pymunk_state = {name: getattr(sprite.pymunk, name) for name in PYMUNK_ATTRIBUTES}
+            self.sprite_state.append((sprite, sprite.position, sprite.angle, attributes, pymunk_state))
+        self.store_rows = [sprite.row for sprite in self.physics_objects if hasattr(sprite, "row")]
+        self.store_state = entity_store.save_rows(self.store_rows)
+
+    def restore(self, view):
+        """ Put the level back on the view as it was when the snapshot was taken """
+        for name, value in self.view_state.items():
+            setattr(view, name, value)
+
+        # Bullets in flight are parked, they were never part of the level
+        view.bullet_pool.release_all()
+
+        for name, sprites in self.sprite_lists.items():
+            sprite_list = getattr(view, name)
+            if sprite_list.sprite_list != sprites:
+                sprite_list.clear()
+                sprite_list.extend(sprites)
+
+        # Put back the bodies of destroyed and dormant sprites
+        engine = view.physics_engine
+        for sprite, physics_object in self.physics_objects.items():
+            if sprite not in engine.sprites:
+                engine.sprites[sprite] = physics_object
+                sprite.register_physics_engine(engine)
+            if physics_object.body.space is None:
+                engine.space.add(physics_object.body, physics_object.shape)
+        engine.non_static_sprite_list[:] = self.non_static_sprites
+
+        for body, position, velocity, angle, angular_velocity in self.bodies:
+            body.position = position
+            body.velocity = velocity
+            body.angle = angle
+            body.angular_velocity = angular_velocity
+            body.force = (0, 0)
+            body.torque = 0
+
+        for sprite, position, angle, attributes, pymunk_state in self.sprite_state:
+            sprite.position = position
+            sprite.angle = angle
+            for name, value in attributes.items():
+                setattr(sprite, name, value)
+            for name, value in pymunk_state.items():
+                setattr(sprite.pymunk, name, value)
+        entity_store.restore_rows(self.store_rows, self.store_state)
+
+        view.enemy_system.reset()
@@ -0,0 +1,234 @@
+"""Very large levels loaded in chunks around the player
+
+A compiled map bigger than STREAMING_MIN_CELLS keeps its tiles as records
+instead of sprites. LevelStreamer splits them into square chunks of
+STREAM_CHUNK_TILES tiles, the same squares the level's ChunkedSpriteLayers
+draw, and only the chunks within STREAM_LOAD_RADIUS of the player get
+sprites and a static pymunk body of merged wall shapes. Chunks further than
+STREAM_UNLOAD_RADIUS are taken out again and kept built in a least recently
+used cache of STREAM_CACHE_CHUNKS, so walking back into one only puts its
+sprites and shapes back. Chunks only load and unload when the player moves
+into another chunk.
+
+Dynamic items and enemies are created the first time their chunk loads and
+move freely after that. Enemies go dormant through EnemySystem, and items
+are parked the same way: out of the space and out of item_list while
+further than ENEMY_DEACTIVATION_RADIUS, until the player comes within
+ENEMY_ACTIVATION_RADIUS. Moving platforms are few, so they are always
+loaded.
+"""
+import math
+from collections import OrderedDict
+import arcade
+import numpy as np
+import constants as game
+from levels import get_object_cells
+from walls import static_walls
+
+# Tile layer whose chunks get wall shapes
+WALL_LAYER = "Platforms"
+
+# Tile layer whose tiles become dynamic items
+ITEM_LAYER = "Dynamic Items"
+
+# Tile layer the player touches to finish the level
+GOAL_LAYER = "Goal"
+
+
+class StreamedChunk:
+    """ The sprites and wall shapes of one chunk, kept while it is loaded or cached """
+    def __init__(self, sprite_lists, wall_body, wall_shapes):
+        # SpriteList per drawn tile layer
+        self.sprite_lists = sprite_lists
+        self.wall_body = wall_body
+        self.wall_shapes = wall_shapes
+
+
+class LevelStreamer:
+    """ Keeps the chunks of a streamed map around the player loaded
+
+    layers maps the name of each drawn tile layer to the ChunkedSpriteLayer
+    its chunks are drawn through. Walls, goals, items and enemies go to the
+    view's physics engine, goal_list, item_list and enemy_list.
+    """
+    def __init__(self, view, tile_map, layers):
+        self.view = view
+        self.tile_map = tile_map
+        self.layers = layers
+        self.tile_width = tile_map.tile_width * tile_map.scaling
+        self.tile_height = tile_map.tile_height * tile_map.scaling
+        self.chunk_size = game.STREAM_CHUNK_TILES * self.tile_width
+
+        # Tile records per layer, then per (chunk column, chunk row)
+        self.records = {name: self._by_chunk(records)
+                        for name, (records, _visible, _alpha, _properties) in tile_map.tile_layers.items()}
+        self.alpha = {name: alpha for name, (_records, _visible, alpha, _properties) in tile_map.tile_layers.items()}
+
+        # Enemy spawns per chunk, as (cartesian cell, object) pairs
+        self.enemy_spawns = {}
+        for cartesian, my_object in get_object_cells(tile_map, "Enemies"):
+            key = (math.floor(cartesian[0] / game.STREAM_CHUNK_TILES), math.floor(cartesian[1] / game.STREAM_CHUNK_TILES))
+            self.enemy_spawns.setdefault(key, []).append((cartesian, my_object))
+
+        # Chunks with anything in them, the only ones worth loading
+        self.chunk_keys = set(self.enemy_spawns)
+        for chunks in self.records.values():
+            self.chunk_keys.update(chunks)
+
+        self.loaded = {}
+        self.cache = OrderedDict()
+
+        # Chunks whose items and enemies were created
+        self.populated = set()
+
+        # Parked items by the chunk they were parked in
+        self.parked = {}
+
+        # Chunk the player was in at the last load
+        self.center = None
+
+    def _by_chunk(self, records):
+        """ Split a layer's tile records by the chunk each tile's center falls in """
+        chunks = {}
+        if not len(records):
+            return chunks
+        chunk_x = np.floor((records["column"] + 0.5) * self.tile_width / self.chunk_size).astype(np.intp)
+        chunk_y = np.floor((self.tile_map.height - records["row"] - 0.5) * self.tile_height / self.chunk_size) \
+            .astype(np.intp)
+        keys, inverse = np.unique(np.stack((chunk_x, chunk_y), axis=1), axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        order = np.argsort(inverse, kind="stable")
+        splits = np.cumsum(np.bincount(inverse))[:-1]
+        for key, group in zip(keys.tolist(), np.split(records[order], splits)):
+            chunks[tuple(key)] = group
+        return chunks
+
+    def chunk_at(self, x, y):
+        return math.floor(x / self.chunk_size), math.floor(y / self.chunk_size)
+
+    def _distance(self, key, x, y):
+        """ How far a point is from the nearest edge of a chunk, 0 inside it """
+        left = key[0] * self.chunk_size
+        bottom = key[1] * self.chunk_size
+        dx = max(left - x, 0, x - left - self.chunk_size)
+        dy = max(bottom - y, 0, y - bottom - self.chunk_size)
+        return math.hypot(dx, dy)
+
+    def update(self, x, y):
+        """ Stream chunks and park or wake items around the player's position """
+        key = self.chunk_at(x, y)
+        if key != self.center:
+            self.center = key
+            for loaded_key in [loaded_key for loaded_key in self.loaded
+                               if self._distance(loaded_key, x, y) > game.STREAM_UNLOAD_RADIUS]:
+                self._unload(loaded_key)
+
+            reach = math.ceil(game.STREAM_LOAD_RADIUS / self.chunk_size)
+            for row in range(key[1] - reach, key[1] + reach + 1):
+                for column in range(key[0] - reach, key[0] + reach + 1):
+                    chunk_key = (column, row)
+                    if chunk_key in self.chunk_keys and chunk_key not in self.loaded and \
+                            self._distance(chunk_key, x, y) < game.STREAM_LOAD_RADIUS:
+                        self._load(chunk_key)
+
+        self._park_items(x, y)
+        if self.parked:
+            self._wake_items(key, x, y)
+
+    def _build(self, key):
+        """ Make a chunk's sprites and wall shapes """
+        sprite_lists = {}
+        for name in self.layers:
+            records = self.records.get(name, {}).get(key)
+            if records is None:
+                continue
+            sprite_list = arcade.SpriteList()
+            sprite_list.extend([self.tile_map.tile_sprite(texture, column, row, self.alpha[name])
+                                for column, row, texture in records.tolist()])
+            sprite_lists[name] = sprite_list
+
+        wall_body = None
+        wall_shapes = []
+        if WALL_LAYER in sprite_lists:
+            wall_body, wall_shapes = static_walls(self.view.physics_engine, sprite_lists[WALL_LAYER],
+                                                  game.WALL_FRICTION, "wall")
+        return StreamedChunk(sprite_lists, wall_body, wall_shapes)
+
+    def _load(self, key):
+        """ Put a chunk in the level, from the cache or built afresh """
+        chunk = self.cache.pop(key, None)
+        if chunk is None:
+            chunk = self._build(key)
+        for name, sprite_list in chunk.sprite_lists.items():
+            self.layers[name].set_chunk(key, sprite_list)
+        if GOAL_LAYER in chunk.sprite_lists:
+            self.view.goal_list.extend(chunk.sprite_lists[GOAL_LAYER])
+        if chunk.wall_body is not None:
+            self.view.physics_engine.space.add(chunk.wall_body, *chunk.wall_shapes)
+        self.loaded[key] = chunk
+
+        if key not in self.populated:
+            self.populated.add(key)
+            self._populate(key)
+
+    def _unload(self, key):
+        """ Take a chunk out of the level, keeping it built in the cache """
+        chunk = self.loaded.pop(key)
+        for name in chunk.sprite_lists:
+            self.layers[name].remove_chunk(key)
+        for goal in chunk.sprite_lists.get(GOAL_LAYER, ()):
+            self.view.goal_list.remove(goal)
+        if chunk.wall_body is not None:
+            self.view.physics_engine.space.remove(chunk.wall_body, *chunk.wall_shapes)
+
+        self.cache[key] = chunk
+        while len(self.cache) > game.STREAM_CACHE_CHUNKS:
+            self.cache.popitem(last=False)
+
+    def _populate(self, key):
+        """ Create the items and enemies that start in a chunk """
+        records = self.records.get(ITEM_LAYER, {}).get(key)
+        if records is not None:
+            for column, row, texture in records.tolist():
+                item = self.tile_map.tile_sprite(texture, column, row, self.alpha[ITEM_LAYER])
+                self.view.item_list.append(item)
+                self.view.add_item_body(item)
+        for cartesian, my_object in self.enemy_spawns.get(key, ()):
+            self.view.spawn_enemy(cartesian, my_object, self.tile_map)
+
+    def _park_items(self, x, y):
+        """ Take the items far from the player out of the simulation """
+        radius = game.ENEMY_DEACTIVATION_RADIUS
+        far = [item for item in self.view.item_list
+               if (item.center_x - x) ** 2 + (item.center_y - y) ** 2 > radius * radius]
+        engine = self.view.physics_engine
+        for item in far:
+            physics_object = engine.get_physics_object(item)
+            engine.space.remove(physics_object.body, physics_object.shape)
+            engine.non_static_sprite_list.remove(item)
+            self.view.item_list.remove(item)
+            self.parked.setdefault(self.chunk_at(item.center_x, item.center_y), []).append(item)
+
+    def _wake_items(self, key, x, y):
+        """ Put the parked items near the player back """
+        radius = game.ENEMY_ACTIVATION_RADIUS
+        reach = math.ceil(radius / self.chunk_size)
+        engine = self.view.physics_engine
+        for row in range(key[1] - reach, key[1] + reach + 1):
+            for column in range(key[0] - reach, key[0] + reach + 1):
+                items = self.parked.get((column, row))
+                if not items:
+                    continue
+                still_parked = []
+                for item in items:
+                    if (item.center_x - x) ** 2 + (item.center_y - y) ** 2 < radius * radius:
+                        physics_object = engine.get_physics_object(item)
+                        engine.space.add(physics_object.body, physics_object.shape)
+                        engine.non_static_sprite_list.append(item)
+                        self.view.item_list.append(item)
+                    else:
+                        still_parked.append(item)
+                if still_parked:
+                    self.parked[(column, row)] = still_parked
+                else:
+                    del self.parked[(column, row)]
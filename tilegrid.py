@@ -0,0 +1,109 @@
+import math
+
+
+class TileGrid:
+    """ Occupancy bitmap of a tile layer, one byte per map cell
+
+    Rows count up from the bottom of the map, matching arcade's cartesian
+    coordinates. Built once per level so "is there a tile here" becomes a
+    lookup instead of a collision check against a whole SpriteList.
+    """
+    def __init__(self, columns, rows, cell_width, cell_height):
+        self.columns = columns
+        self.rows = rows
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+        self.cells = bytearray(columns * rows)
+
+        # Per column running count of occupied cells, so a vertical span is one subtraction
+        self._column_totals = None
+
+    @classmethod
+    def from_sprite_list(cls, sprite_list, columns, rows, cell_width, cell_height):
+        """ Mark every cell covered by a sprite's hit box """
+        grid = cls(columns, rows, cell_width, cell_height)
+        for sprite in sprite_list:
+            grid.mark(sprite.left, sprite.bottom, sprite.right, sprite.top)
+        return grid
+
+    @classmethod
+    def from_cells(cls, cells, columns, rows, cell_width, cell_height):
+        """ Mark each (column, row) cell """
+        grid = cls(columns, rows, cell_width, cell_height)
+        for column, row in cells:
+            grid.cells[row * columns + column] = 1
+        return grid
+
+    @classmethod
+    def from_tile_map(cls, tile_map, layer_name):
+        """ Build the grid for one sprite layer of a loaded tile map """
+        if hasattr(tile_map, "tile_cells"):
+            # A compiled map knows its tiles' cells without sprites, and every tile fills exactly its own cell
+            layer_columns, layer_rows = tile_map.tile_cells(layer_name)
+            return cls.from_cells(zip(layer_columns.tolist(), layer_rows.tolist()),
+                                  tile_map.width, tile_map.height,
+                                  tile_map.tile_width * tile_map.scaling,
+                                  tile_map.tile_height * tile_map.scaling)
+        return cls.from_sprite_list(tile_map.sprite_lists[layer_name],
+                                    tile_map.width, tile_map.height,
+                                    tile_map.tile_width * tile_map.scaling,
+                                    tile_map.tile_height * tile_map.scaling)
+
+    def mark(self, left, bottom, right, top):
+        """ Set every cell overlapping a rectangle """
+        first_column, first_row, last_column, last_row = self.cell_range(left, bottom, right, top)
+        for row in range(first_row, last_row + 1):
+            start = row * self.columns
+            self.cells[start + first_column:start + last_column + 1] = b"\x01" * (last_column - first_column + 1)
+        self._column_totals = None
+
+    def cell_at(self, x, y):
+        """ The (column, row) a point falls in """
+        return math.floor(x / self.cell_width), math.floor(y / self.cell_height)
+
+    def cell_range(self, left, bottom, right, top):
+        """ First and last cells overlapped by a rectangle, clamped to the map """
+        first_column = max(0, math.floor(left / self.cell_width))
+        first_row = max(0, math.floor(bottom / self.cell_height))
+        last_column = min(self.columns - 1, math.ceil(right / self.cell_width) - 1)
+        last_row = min(self.rows - 1, math.ceil(top / self.cell_height) - 1)
+        return first_column, first_row, last_column, last_row
+
+    def is_solid(self, column, row):
+        """ Is there a tile in this cell """
+        if 0 <= column < self.columns and 0 <= row < self.rows:
+            return self.cells[row * self.columns + column] != 0
+        return False
+
+    def is_solid_at(self, x, y):
+        """ Is there a tile at this point """
+        return self.is_solid(*self.cell_at(x, y))
+
+    def any_in_rect(self, left, bottom, right, top):
+        """ Does any tile overlap this rectangle """
+        return self.any_in_range(*self.cell_range(left, bottom, right, top))
+
+    def any_in_range(self, first_column, first_row, last_column, last_row):
+        """ Is any cell occupied in an inclusive range from cell_range() """
+        if first_column > last_column or first_row > last_row:
+            return False
+        if self._column_totals is None:
+            self._build_column_totals()
+        stride = self.rows + 1
+        totals = self._column_totals
+        for column in range(first_column, last_column + 1):
+            base = column * stride
+            if totals[base + last_row + 1] - totals[base + first_row]:
+                return True
+        return False
+
+    def _build_column_totals(self):
+        stride = self.rows + 1
+        totals = [0] * (self.columns * stride)
+        for column in range(self.columns):
+            base = column * stride
+            running = 0
+            for row in range(self.rows):
+                running += self.cells[row * self.columns + column]
+                totals[base + row + 1] = running
+        self._column_totals = totals
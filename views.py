@@ -1,17 +1,61 @@
 import arcade
+import logging
 import math
+import assets
 import constants as game
+import levels
+from bullets import BulletPool
+from animation import AnimationSystem
+from enemies import EnemySystem
+from profiler import FrameProfiler, ProfilerOverlay
+from walls import add_static_walls, collision_type_id
+from replay import InputRecorder
+from snapshot import LevelSnapshot
+from streaming import LevelStreamer
+from rendering import BakedSpriteLayer, FrozenFrame, visible_rect
 from entities import Player, RobotEnemy, SuperRobot
 from typing import Optional
 
-class TitleView(arcade.View):
+# Keys whose effect on the game is applied on the next fixed step and recorded
+GAMEPLAY_KEYS = (arcade.key.A, arcade.key.D, arcade.key.W, arcade.key.S, arcade.key.SPACE)
+
+
+class PreloadingView(arcade.View):
+    """ A menu screen shown while the game's assets load in the background
+
+    Asking to start the game before everything is loaded starts it as soon
+    as loading finishes, with a progress bar shown in the meantime.
+    """
+    def __init__(self) -> None:
+        super().__init__()
+        self.loader = assets.preload()
+        self.start_requested = False
+
+    def start_game(self) -> None:
+        """Show the game, now or once the assets are loaded"""
+        self.start_requested = True
+
+    def on_update(self, delta_time: float) -> None:
+        if self.start_requested and self.loader.done:
+            game_view = GameView(level_prefetcher=self.loader.level_prefetcher)
+            game_view.setup()
+            self.window.show_view(game_view)
+
+    def draw_progress(self) -> None:
+        """Draw a loading bar along the bottom of the screen until the assets are loaded"""
+        if self.loader.done:
+            return
+        arcade.draw_lrtb_rectangle_filled(0, game.SCREEN_WIDTH * self.loader.progress, 6, 0, arcade.color.WHITE)
+
+
+class TitleView(PreloadingView):
     """Displays a title screen and prompts the user to begin the game.
     Provides a way to show instructions and start the game.
     """
     def __init__(self) -> None:
         super().__init__()
 
-        title_image_path = "assets/images/title_image.png"
+        title_image_path = assets.image_path("title_image.png")
         # Load our title image
         self.title_image = arcade.load_texture(title_image_path)
 
@@ -30,25 +74,24 @@ class TitleView(arcade.View):
             height=game.SCREEN_HEIGHT,
             texture=self.title_image,
         )
+        self.draw_progress()
         
     def on_key_press(self, key: int, modifiers: int) -> None:
         """Resume the game when the user presses ESC again"""
         if key == arcade.key.RETURN:
-            game_view = GameView()
-            game_view.setup()
-            self.window.show_view(game_view)
+            self.start_game()
         elif key == arcade.key.I:
             instructions_view = InstructionsView()
             self.window.show_view(instructions_view)
 
-class InstructionsView(arcade.View):
+class InstructionsView(PreloadingView):
     """Show instructions to the player"""
 
     def __init__(self) -> None:
         """Create instructions screen"""
         super().__init__()
 
-        instructions_image_path = "assets/images/instructions screen.png"
+        instructions_image_path = assets.image_path("instructions screen.png")
 
         # Load our title image
         self.instructions_image = arcade.load_texture(instructions_image_path)
@@ -65,6 +108,7 @@ class InstructionsView(arcade.View):
             height=game.SCREEN_HEIGHT,
             texture=self.instructions_image,
         )
+        self.draw_progress()
 
     def on_key_press(self, key: int, modifiers: int) -> None:
         """Start the game when the user presses Enter
@@ -74,44 +118,77 @@ class InstructionsView(arcade.View):
             modifiers -- What modifiers were active
         """
         if key == arcade.key.RETURN:
-            game_view = GameView()
-            game_view.setup()
-            self.window.show_view(game_view)
+            self.start_game()
 
         elif key == arcade.key.ESCAPE:
             title_view = TitleView()
             self.window.show_view(title_view)
 
-# Pause view, used when the player pauses the game
-class PauseView(arcade.View):
+class FrozenOverlayView(arcade.View):
+    """ Text over the last frame of a game that is no longer moving
+
+    The first draw renders the game view and a dimming rectangle once into
+    a FrozenFrame and builds the text. After that each frame is a copy of
+    that frame and the text, without drawing the level again. The text is
+    placed relative to the player, where the game view showed them. The
+    frame is captured again after the window is resized, and released once
+    the view is left.
+    """
+    # (text, offset from the player's height, color, font size) of each line
+    lines = ()
+
     def __init__(self, game_view):
         super().__init__()
         self.game_view = game_view
         self.fill_color = (0, 0, 0, 150)  # Semi-transparent black
+        self.frozen_frame = None
+        self.texts = []
 
-    def on_draw(self) -> None:
-        """Draw the underlying screen, blurred, then the Paused text"""
+    def capture(self):
+        """Freeze the game view's frame, dimmed, and lay out the text over it"""
+        self.frozen_frame = FrozenFrame(self.draw_dimmed_game)
 
-        # Use the game view's camera to draw the game elements
-        self.game_view.camera.use()
+        # Where the player is on the screen
+        camera_x, camera_y = self.game_view.camera.position
+        player_x = self.game_view.player_sprite.center_x - camera_x
+        player_y = self.game_view.player_sprite.center_y - camera_y
 
-        # Draw the game view
+        self.texts = [arcade.Text(text, player_x, player_y + offset, color, font_size,
+                                  anchor_x="center", anchor_y="center")
+                      for text, offset, color, font_size in self.lines]
+
+    def draw_dimmed_game(self):
+        """Draw the game view with a semi-transparent rectangle over it"""
         self.game_view.on_draw()
+        self.game_view.gui_camera.use()
+        arcade.draw_lrtb_rectangle_filled(0, game.SCREEN_WIDTH, game.SCREEN_HEIGHT, 0, self.fill_color)
 
-        # Get the player's position
-        player_x = self.game_view.player_sprite.center_x
-        player_y = self.game_view.player_sprite.center_y
-
-        # show the Pause text centered relative to the player's position
-        arcade.draw_text(
-            "PAUSED - ESC TO CONTINUE",
-            start_x=player_x,
-            start_y=player_y,
-            color=arcade.color.INDIGO,
-            font_size=40,
-            anchor_x="center",
-            anchor_y="center"
-        )
+    def release(self):
+        """Free the frozen frame, it is captured again if the view is drawn"""
+        if self.frozen_frame is not None:
+            self.frozen_frame.release()
+            self.frozen_frame = None
+
+    def on_resize(self, width: int, height: int) -> None:
+        self.release()
+
+    def on_hide_view(self) -> None:
+        self.release()
+
+    def on_draw(self) -> None:
+        """Draw the frozen game frame, then the text"""
+        if self.frozen_frame is None:
+            self.capture()
+
+        self.frozen_frame.draw()
+        self.game_view.gui_camera.use()
+        for text in self.texts:
+            text.draw()
+
+
+# Pause view, used when the player pauses the game
+class PauseView(FrozenOverlayView):
+    lines = (("PAUSED - ESC TO CONTINUE", 0, arcade.color.INDIGO, 40),)
 
     def on_key_press(self, key: int, modifiers: int) -> None:
         """Resume the game when the user presses ESC again
@@ -123,108 +200,52 @@ class PauseView(arcade.View):
         if key == arcade.key.ESCAPE:
             self.window.show_view(self.game_view)
 
-class GameOverView(arcade.View):
-    def __init__(self, game_view):
-        super().__init__()
-        self.game_view = game_view
-        self.fill_color = (0, 0, 0, 150)  # Semi-transparent black
-
-    def on_draw(self) -> None:
-        """Draw the underlying screen, blurred, then the Game Over text"""
-
-        # Use the game view's camera to draw the game elements
-        self.game_view.camera.use()
-
-        # Draw the game view
-        self.game_view.on_draw()
-
-        # Get the player's position
-        player_x = self.game_view.player_sprite.center_x
-        player_y = self.game_view.player_sprite.center_y
-
-        # show the Game Over text centered relative to the player's position
-        arcade.draw_text(
-            "GAME OVER",
-            start_x=player_x,
-            start_y=player_y + 50,  
-            color=arcade.color.RED,
-            font_size=50,
-            anchor_x="center",
-            anchor_y="center"
-        )
-
-        arcade.draw_text(
-            "Press ENTER to Restart",
-            start_x=player_x,
-            start_y=player_y - 50,  
-            color=arcade.color.WHITE,
-            font_size=20,
-            anchor_x="center",
-            anchor_y="center"
-        )
+class GameOverView(FrozenOverlayView):
+    lines = (
+        ("GAME OVER", 50, arcade.color.RED, 50),
+        ("Press ENTER to Restart", -50, arcade.color.WHITE, 20),
+    )
 
     def on_key_press(self, key, modifiers):
         if key == arcade.key.ENTER:
-            game_view = GameView()
-            game_view.setup()
-            self.window.show_view(game_view)
+            self.game_view.restart()
+            self.window.show_view(self.game_view)
 
-class WinView(arcade.View):
-    def __init__(self, game_view):
-        super().__init__()
-        self.game_view = game_view
+class WinView(FrozenOverlayView):
+    lines = (
+        ("YOU WIN!", 50, arcade.color.WHITE, 50),
+        ("Press ENTER to Restart", -50, arcade.color.WHITE, 20),
+    )
 
     def on_show(self):
         arcade.set_background_color(arcade.color.DARK_SLATE_GRAY)
 
-    def on_draw(self):
-        """Draw the underlying screen, blurred, then the Win text"""
-
-        # Use the game view's camera to draw the game elements
-        self.game_view.camera.use()
-
-        # Draw the game view
-        self.game_view.on_draw()
-
-        # Get the player's position
-        player_x = self.game_view.player_sprite.center_x
-        player_y = self.game_view.player_sprite.center_y
-
-        # Now show the Win text centered relative to the player's position
-        arcade.draw_text(
-            "YOU WIN!",
-            start_x=player_x,
-            start_y=player_y + 50,  
-            color=arcade.color.WHITE,
-            font_size=50,
-            anchor_x="center",
-            anchor_y="center"
-        )
-
-        arcade.draw_text(
-            "Press ENTER to Restart",
-            start_x=player_x,
-            start_y=player_y - 50,  # Adjust the y position if needed
-            color=arcade.color.WHITE,
-            font_size=20,
-            anchor_x="center",
-            anchor_y="center"
-        )
-
     def on_key_press(self, key, modifiers):
         if key == arcade.key.ENTER:
-            game_view = GameView()
-            game_view.setup()
-            self.window.show_view(game_view)
+            self.game_view.restart()
+            self.window.show_view(self.game_view)
+
 
 class GameView(arcade.View):
     """ Main Window """
-    def __init__(self):
-        super().__init__()
+    def __init__(self, headless=False, level_prefetcher=None, maps_path=None):
+        # A headless view runs only the game logic, with no window, drawing or sound
+        self.headless = headless
+        if headless:
+            self.window = None
+            self.key = None
+        else:
+            super().__init__()
         self.display_timer = 0
         self.view_left = 0
         self.view_bottom = 0
         self.level = 1
+
+        # Loads the next level in the background while this one is played
+        self.level_prefetcher = level_prefetcher if level_prefetcher is not None else levels.LevelPrefetcher()
+
+        # Directory the level maps are read from, None for the game's own
+        self.maps_path = maps_path
         
         # Player sprite
         self.player_sprite: Optional[Player] = None
@@ -240,6 +261,12 @@ class GameView(arcade.View):
         self.enemy_list: Optional[arcade.SpriteList] = None
         self.goal_list: Optional[arcade.SpriteList] = None
 
+        # Static layers drawn in chunks, some of them baked
+        self.background_layer = None
+        self.wall_layer = None
+        self.ladder_layer = None
+        self.goal_layer = None
+
         # Track the current state of what key is pressed
         self.left_pressed: bool = False
         self.right_pressed: bool = False
@@ -249,22 +276,72 @@ class GameView(arcade.View):
         # Physics engine
         self.physics_engine: Optional[arcade.PymunkPhysicsEngine] = None
 
-        # Set background color
-        arcade.set_background_color(arcade.color.CHARCOAL)
+        # Picks the player's and enemies' textures after each step
+        self.animation_system = AnimationSystem()
+
+        # Frame time not yet simulated, always less than one fixed step after on_update
+        self.accumulator = 0.0
+
+        # Where each moving sprite was before the last step, for drawing in between steps
+        self.previous_positions = {}
+
+        # Times each phase of the frame, shown by the overlay F3 toggles
+        self.profiler = FrameProfiler(game.PROFILER_ENABLED)
+        self.profiler_overlay = None
+
         self.end_of_map = 0
 
         # Keep track of the score
         self.score = 0
 
+        # "won" or "game over" once the run has ended
+        self.outcome = None
+
+        # Fixed steps simulated so far, and input waiting for the next one
+        self.tick = 0
+        self.pending_input = []
+
+        # Logs the input of the run when INPUT_RECORDING_ENABLED
+        self.input_recorder = None
+
+        # The run's first level, and for restart() that level as setup() left it
+        self.first_level = None
+        self.restart_snapshot = None
+
+        # Streams the chunks of a level too big to load whole, None for other levels
+        self.level_streamer = None
+
+        if headless:
+            self.jump_sound = None
+            self.game_over = None
+            return
+
+        # Set background color
+        arcade.set_background_color(arcade.color.CHARCOAL)
+
         # Load sounds
-        self.jump_sound = arcade.load_sound(":resources:sounds/jump1.wav")
-        self.game_over = arcade.load_sound(":resources:sounds/gameover1.wav")
+        self.jump_sound = assets.get_sound(assets.JUMP_SOUND)
+        self.game_over = assets.get_sound(assets.GAME_OVER_SOUND)
             
     def setup(self):
         """ Set up everything with the game """
+        # The level being left, if any, no longer needs its baked textures
+        self.release_static_layers()
+
          # Initialize the camera
-        self.camera = arcade.Camera(game.SCREEN_WIDTH, game.SCREEN_HEIGHT)
-        
+        if not self.headless:
+            self.camera = arcade.Camera(game.SCREEN_WIDTH, game.SCREEN_HEIGHT)
+
+            # Screen space camera for the profiler overlay
+            self.gui_camera = arcade.Camera(game.SCREEN_WIDTH, game.SCREEN_HEIGHT)
+
+        # Start the simulation clock over
+        self.accumulator = 0.0
+        self.previous_positions = {}
+
+        # A recording starts with the run's first level, later levels are part of its replay
+        if game.INPUT_RECORDING_ENABLED and self.input_recorder is None and not self.headless:
+            self.input_recorder = InputRecorder(self.level)
 
         # Create the sprite lists
         self.player_list = arcade.SpriteList()
@@ -272,16 +349,28 @@ class GameView(arcade.View):
         self.enemy_list = arcade.SpriteList()
 
         # Map name
-        map_name = f"level_{self.level}.json"
-        map_path = game.ASSETS_PATH / "maps" / map_name
+        map_path = levels.level_map_path(self.level, self.maps_path)
         
-        # Load in TileMap
-        tile_map = arcade.load_tilemap(map_path, game.SPRITE_SCALING_TILES)
+        # Load in TileMap with its grids, wall shapes and routes, prefetched if possible, else from its
+        # compiled form when one is up to date
+        prepared = self.level_prefetcher.take(map_path, game.SPRITE_SCALING_TILES)
+        if prepared is None:
+            prepared = levels.PreparedLevel(levels.load_level(map_path, game.SPRITE_SCALING_TILES))
+        tile_map = prepared.tile_map
+
+        # Start preparing the next level while this one is played
+        if self.level < game.LEVEL_COUNT:
+            self.level_prefetcher.prefetch(levels.level_map_path(self.level + 1, self.maps_path),
+                                           game.SPRITE_SCALING_TILES)
 
         # Get the map dimensions from the tile_map object
         self.map_width = tile_map.width * tile_map.tile_width
         self.map_height = tile_map.height * tile_map.tile_height
 
+        # Streamed maps only get sprites and shapes near the player, their tile layers start out empty.
+        # Maps loaded from Tiled JSON are always whole
+        streamed = getattr(tile_map, "streamed", False)
+
         # Pull the sprite layers out of the tile map
         self.wall_list = tile_map.sprite_lists["Platforms"]
         self.item_list = tile_map.sprite_lists["Dynamic Items"]
@@ -290,39 +379,33 @@ class GameView(arcade.View):
         self.background_list = tile_map.sprite_lists["Background"]
         self.goal_list = tile_map.sprite_lists["Goal"]
 
+        # The static layers come split into chunks, so only those near the camera are drawn
+        self.background_layer = prepared.static_layers["Background"]
+        self.wall_layer = prepared.static_layers["Platforms"]
+        self.ladder_layer = prepared.static_layers["Ladders"]
+        self.goal_layer = prepared.static_layers["Goal"]
+
+        # Layers that never change are drawn from textures rendered now, before the level's first frame.
+        # Empty layers, like every shipped level's Background, have nothing to bake
+        if game.BAKE_STATIC_LAYERS and not streamed:
+            if self.background_layer.chunks:
+                self.background_layer = BakedSpriteLayer(self.background_layer)
+            if self.wall_layer.chunks:
+                self.wall_layer = BakedSpriteLayer(self.wall_layer)
+            self.bake_static_layers()
+
+        # The platforms indexed by tile cell, so enemies can look up the ground cheaply
+        self.platform_grid = prepared.platform_grid
+        self.ladder_grid = prepared.ladder_grid
+
         # Create player sprite
-        self.player_sprite = Player(self.ladder_list, hit_box_algorithm="Simple")
-        
-        # Load the "Enemies" object layer
-        enemies_layer = tile_map.object_lists["Enemies"]
+        self.player_sprite = Player(self.ladder_grid, hit_box_algorithm="Simple")
         
-        
-
-        for my_object in enemies_layer:
-            cartesian = tile_map.get_cartesian(
-                my_object.shape[0], my_object.shape[1]
-            )
-            enemy_type = my_object.properties["type"]
-            if enemy_type == "robot":
-                enemy = RobotEnemy(self.wall_list)
-            elif enemy_type == "superrobot":
-                enemy = SuperRobot(self.wall_list)
-            enemy.center_x = math.floor(
-                cartesian[0] * game.SPRITE_SCALING_TILES * tile_map.tile_width
-            )
-            enemy.center_y = math.floor(
-                (cartesian[1] + 1) * (tile_map.tile_height * game.SPRITE_SCALING_TILES)
-            )
-            if "boundary_left" in my_object.properties:
-                enemy.boundary_left = my_object.properties["boundary_left"]
-            if "boundary_right" in my_object.properties:
-                enemy.boundary_right = my_object.properties["boundary_right"]
-            if "change_x" in my_object.properties:
-                enemy.change_x = my_object.properties["change_x"]
-            self.enemy_list.append(enemy)
-
-           
-    
+        # Load the "Enemies" object layer along with each spawn's tile cell. A streamed level
+        # spawns each enemy when its chunk first loads instead
+        if not streamed:
+            for cartesian, my_object in levels.get_object_cells(tile_map, "Enemies"):
+                self.enemy_list.append(self.create_enemy(cartesian, my_object, tile_map))
 
         # Set player location
         grid_x = 1
@@ -341,19 +424,34 @@ class GameView(arcade.View):
         self.physics_engine = arcade.PymunkPhysicsEngine(damping=damping,
                                                          gravity=gravity)
 
-        def wall_hit_handler(bullet_sprite, _wall_sprite, _arbiter, _space, _data):
+        # Bullets are recycled rather than created per shot
+        self.bullet_pool = BulletPool(self.physics_engine, self.bullet_list, self.map_width, self.map_height)
+
+        def wall_hit_handler(arbiter, _space, _data):
             """ Called for bullet/wall collision """
-            bullet_sprite.remove_from_sprite_lists()
+            # Merged walls have no sprite, so arcade's sprite based handlers would never fire
+            bullet_sprite = self.bullet_pool.bullet_for_shape(arbiter.shapes[0])
+            if bullet_sprite is not None:
+                self.bullet_pool.release(bullet_sprite)
 
-        self.physics_engine.add_collision_handler("bullet", "wall", post_handler=wall_hit_handler)
+        wall_handler = self.physics_engine.space.add_collision_handler(
+            collision_type_id(self.physics_engine, "bullet"), collision_type_id(self.physics_engine, "wall"))
+        wall_handler.post_solve = wall_hit_handler
 
         def item_hit_handler(bullet_sprite, item_sprite, _arbiter, _space, _data):
             """ Called for bullet/item collision """
-            bullet_sprite.remove_from_sprite_lists()
+            self.bullet_pool.release(bullet_sprite)
             item_sprite.remove_from_sprite_lists()
 
         self.physics_engine.add_collision_handler("bullet", "item", post_handler=item_hit_handler)
 
+        def enemy_hit_handler(bullet_sprite, enemy_sprite, _arbiter, _space, _data):
+            """ Called for bullet/enemy collision """
+            self.bullet_pool.release(bullet_sprite)
+            enemy_sprite.take_damage(enemy_sprite.default_damage)
+
+        self.physics_engine.add_collision_handler("bullet", "enemy", post_handler=enemy_hit_handler)
+
         self.physics_engine.add_sprite(self.player_sprite,
                                        friction=game.PLAYER_FRICTION,
                                        mass=game.PLAYER_MASS,
@@ -362,15 +460,13 @@ class GameView(arcade.View):
                                        max_horizontal_velocity=game.PLAYER_MAX_HORIZONTAL_SPEED,
                                        max_vertical_velocity=game.PLAYER_MAX_VERTICAL_SPEED)
 
-        self.physics_engine.add_sprite_list(self.wall_list,
-                                            friction=game.WALL_FRICTION,
-                                            collision_type="wall",
-                                            body_type=arcade.PymunkPhysicsEngine.STATIC)
+        # The platforms never move, so they share one static body of merged rectangles
+        if not streamed:
+            add_static_walls(self.physics_engine, prepared.walls, game.WALL_FRICTION, "wall")
 
         # Create the items
-        self.physics_engine.add_sprite_list(self.item_list,
-                                            friction=game.DYNAMIC_ITEM_FRICTION,
-                                            collision_type="item")
+        for item in self.item_list:
+            self.add_item_body(item)
 
         # Add kinematic sprites
         self.physics_engine.add_sprite_list(self.moving_sprites_list,
@@ -378,10 +474,181 @@ class GameView(arcade.View):
         
         # Add the enemies to the physics engine
         for enemy in self.enemy_list:
-            self.physics_engine.add_sprite(enemy, friction=0.6, mass=2.0, moment=arcade.PymunkPhysicsEngine.MOMENT_INF)
+            self.add_enemy_body(enemy)
+
+        # Load the chunks around the player, with their walls, items and enemies
+        self.level_streamer = None
+        if streamed:
+            self.level_streamer = LevelStreamer(self, tile_map, {"Background": self.background_layer,
+                                                                 "Platforms": self.wall_layer,
+                                                                 "Ladders": self.ladder_layer,
+                                                                 "Goal": self.goal_layer})
+            self.level_streamer.update(self.player_sprite.center_x, self.player_sprite.center_y)
+
+        # Steers every awake enemy at once, picking up enemies added or killed later
+        self.enemy_system = EnemySystem(self.enemy_list, self.platform_grid, self.ladder_grid, self.physics_engine,
+                                        prepared.navigation)
+
+        # Keep the run's first level as it starts, restarts restore it instead of loading it again.
+        # A streamed level changes as it streams, so restarting one loads it again
+        if self.first_level is None:
+            self.first_level = self.level
+            if self.level_streamer is None:
+                self.restart_snapshot = LevelSnapshot(self)
+
+    def bake_static_layers(self):
+        """ Render the baked layers that aren't yet, a window is needed """
+        if self.headless:
+            return
+        for layer in (self.background_layer, self.wall_layer):
+            if isinstance(layer, BakedSpriteLayer) and layer.baked is None:
+                layer.bake()
+
+    def release_static_layers(self):
+        """ Free the textures of the current level's baked layers """
+        for layer in (self.background_layer, self.wall_layer):
+            if isinstance(layer, BakedSpriteLayer):
+                layer.release()
+
+    def restart(self):
+        """ Start the run over from its first level """
+        if self.restart_snapshot is not None:
+            # The snapshot keeps its level's layers, baked again if the run had moved on from them
+            if self.wall_layer is not self.restart_snapshot.view_state["wall_layer"]:
+                self.release_static_layers()
+            self.restart_snapshot.restore(self)
+            self.bake_static_layers()
+        else:
+            self.level = self.first_level
+            self.score = 0
+            self.setup()
+
+        self.outcome = None
+        self.tick = 0
+        self.pending_input.clear()
+        self.left_pressed = self.right_pressed = self.up_pressed = self.down_pressed = False
+        self.accumulator = 0.0
+        self.previous_positions = {}
+        # Replays start from a freshly loaded level, which a restored one only matches to within rounding,
+        # so the saved recording stays the run that began with the load
+        self.input_recorder = None
+
+        # The next level was taken when the run moved on to it
+        if self.level < game.LEVEL_COUNT:
+            self.level_prefetcher.prefetch(levels.level_map_path(self.level + 1, self.maps_path),
+                                           game.SPRITE_SCALING_TILES)
+
+        if not self.headless:
+            arcade.set_background_color(arcade.color.CHARCOAL)
+
+    def create_enemy(self, cartesian, my_object, tile_map):
+        """ An enemy for a spawn of the "Enemies" object layer, at its tile cell """
+        enemy_type = my_object.properties["type"]
+        if enemy_type == "robot":
+            enemy = RobotEnemy()
+        elif enemy_type == "superrobot":
+            enemy = SuperRobot()
+        enemy.center_x = math.floor(
+            cartesian[0] * game.SPRITE_SCALING_TILES * tile_map.tile_width
+        )
+        enemy.center_y = math.floor(
+            (cartesian[1] + 1) * (tile_map.tile_height * game.SPRITE_SCALING_TILES)
+        )
+        if "boundary_left" in my_object.properties:
+            enemy.boundary_left = my_object.properties["boundary_left"]
+        if "boundary_right" in my_object.properties:
+            enemy.boundary_right = my_object.properties["boundary_right"]
+        if "change_x" in my_object.properties:
+            enemy.change_x = my_object.properties["change_x"]
+        return enemy
+
+    def spawn_enemy(self, cartesian, my_object, tile_map):
+        """ Add an enemy of the "Enemies" object layer to the running level """
+        enemy = self.create_enemy(cartesian, my_object, tile_map)
+        self.enemy_list.append(enemy)
+        self.add_enemy_body(enemy)
+
+    def add_item_body(self, item):
+        """ Give a dynamic item its physics body """
+        self.physics_engine.add_sprite(item, friction=game.DYNAMIC_ITEM_FRICTION, collision_type="item")
+
+    def add_enemy_body(self, enemy):
+        """ Give an enemy its physics body """
+        self.physics_engine.add_sprite(enemy, friction=0.6, mass=2.0, moment=arcade.PymunkPhysicsEngine.MOMENT_INF,
+                                       collision_type="enemy")
 
     def on_key_press(self, key, modifiers):
         """Called whenever a key is pressed. """
+        if key in GAMEPLAY_KEYS:
+            # Applied at the start of the next fixed step, so replays match
+            self.queue_input(("press", key))
+        elif key == arcade.key.F3 and not self.headless:
+            self.toggle_profiler_overlay()
+        elif key == arcade.key.F4:
+            self.toggle_profiler_trace()
+        elif key == arcade.key.F5:
+            self.save_input_recording()
+        elif key == arcade.key.ESCAPE and not self.headless:
+            # Pass the current view to preserve this view's state
+            pause = PauseView(self)
+            self.window.show_view(pause)
+
+    def toggle_profiler_overlay(self):
+        """ Show or hide the frame profiler overlay, profiling only while something uses it """
+        if self.profiler_overlay is None:
+            self.profiler_overlay = ProfilerOverlay(self.profiler)
+            self.profiler.enabled = True
+        else:
+            self.profiler_overlay = None
+            self.profiler.enabled = game.PROFILER_ENABLED or self.profiler.trace is not None
+
+    def toggle_profiler_trace(self):
+        """ Start recording every frame's phase times, or stop and write them out """
+        if self.profiler.trace is None:
+            self.profiler.enabled = True
+            self.profiler.start_trace()
+        else:
+            frames = self.profiler.stop_trace(game.PROFILER_TRACE_PATH)
+            logging.info(f"Wrote {frames} profiled frames to {game.PROFILER_TRACE_PATH}")
+            self.profiler.enabled = game.PROFILER_ENABLED or self.profiler_overlay is not None
+
+    def save_input_recording(self):
+        """ Write the input recorded so far, if recording """
+        if self.input_recorder is not None:
+            events = self.input_recorder.save(self)
+            logging.info(f"Wrote {events} input events to {game.INPUT_RECORDING_PATH}")
+
+    def on_key_release(self, key, modifiers):
+        """Called when the user releases a key. """
+        if key in GAMEPLAY_KEYS:
+            self.queue_input(("release", key))
+
+    def on_mouse_press(self, x, y, button, modifiers):
+        """ Called whenever the mouse button is clicked. """
+        self.queue_input(("shoot", x + self.camera.position[0], y + self.camera.position[1]))
+
+    def queue_input(self, event):
+        """ Hold an input event, ("press", key), ("release", key) or ("shoot", x, y), for the next fixed step """
+        if event[0] not in ("press", "release", "shoot"):
+            raise ValueError(f"Unknown input event: {event[0]}")
+        self.pending_input.append(event)
+
+    def apply_input(self):
+        """ Apply and record the input queued since the last fixed step """
+        for event in self.pending_input:
+            if self.input_recorder is not None:
+                self.input_recorder.record(self.tick, event)
+            action = event[0]
+            if action == "press":
+                self.press(event[1])
+            elif action == "release":
+                self.release(event[1])
+            else:
+                self.shoot(event[1], event[2])
+        self.pending_input.clear()
+
+    def press(self, key):
+        """ Act on a gameplay key going down """
         if key == arcade.key.A:
             self.left_pressed = True
         elif key == arcade.key.D:
@@ -396,14 +663,10 @@ class GameView(arcade.View):
                 impulse = (0, game.PLAYER_JUMP_IMPULSE)
                 self.physics_engine.apply_impulse(self.player_sprite, impulse)
                 self.player_sprite.jump_count += 1  # Increment jump count
-                arcade.play_sound(self.jump_sound)
-        elif key == arcade.key.ESCAPE:
-            # Pass the current view to preserve this view's state
-            pause = PauseView(self)
-            self.window.show_view(pause)
+                self.play_sound(self.jump_sound)
 
-    def on_key_release(self, key, modifiers):
-        """Called when the user releases a key. """
+    def release(self, key):
+        """ Act on a gameplay key coming up """
         if key == arcade.key.A:
             self.left_pressed = False
         elif key == arcade.key.D:
@@ -415,75 +678,116 @@ class GameView(arcade.View):
         elif key == arcade.key.SPACE:
             self.space_pressed = False
 
-    def on_mouse_press(self, x, y, button, modifiers):
-        """ Called whenever the mouse button is clicked. """
-
-        bullet = arcade.Sprite(
-                    ":resources:images/space_shooter/laserBlue01.png",
-                    game.SPRITE_SCALING_LASER
-                )
-        self.bullet_list.append(bullet)
+    def shoot(self, dest_x, dest_y):
+        """ Fire a bullet from the player towards a point on the map """
 
         # Position the bullet at the player's current location
         start_x = self.player_sprite.center_x
         start_y = self.player_sprite.center_y
-        bullet.position = self.player_sprite.position
-
-        dest_x = x + self.camera.position[0]
-        dest_y = y + self.camera.position[1]
 
         x_diff = dest_x - start_x
         y_diff = dest_y - start_y
         angle = math.atan2(y_diff, x_diff)
-        
-        # Use angle to spawn bullet away from player in proper direction
-        bullet.center_x = start_x
-        bullet.center_y = start_y
-
-        # Set angle of bullet
-        bullet.angle = math.degrees(angle)
 
-        bullet_gravity = (0, -game.BULLET_GRAVITY)
+        # Launch a pooled bullet from the player in that direction
+        bullet = self.bullet_pool.fire(self.player_sprite.position, angle)
 
-        # Add the sprite. This needs to be done AFTER setting the fields above.
-        self.physics_engine.add_sprite(bullet,
-                                       mass=game.BULLET_MASS,
-                                       damping=1.0,
-                                       friction=0.6,
-                                       collision_type="bullet",
-                                       gravity=bullet_gravity,
-                                       elasticity=0.9)
+        # A reused bullet must not be drawn sliding in from where it was last parked
+        self.previous_positions[bullet] = bullet.position
 
-        # Set velocity of bullet
-        speed = 5000  # Adjust this value to change the speed of the bullet
-        velocity = (speed * math.cos(angle), speed * math.sin(angle))
-        self.physics_engine.set_velocity(bullet, velocity)
-
-    def center_camera_to_player(self):
-
-        screen_center_x = self.player_sprite.center_x - (self.camera.viewport_width / 2)
+    def camera_position(self):
+        """ Bottom left corner of the screen-sized view centered on the player, kept on the map """
+        screen_center_x = self.player_sprite.center_x - (game.SCREEN_WIDTH / 2)
         screen_center_y = self.player_sprite.center_y - (
-        self.camera.viewport_height / 2
+        game.SCREEN_HEIGHT / 2
         )
 
         # Ensure the camera doesn't go beyond the map boundaries
         screen_center_x = max(0, screen_center_x)
-        screen_center_x = min(self.map_width - self.camera.viewport_width, screen_center_x)
+        screen_center_x = min(self.map_width - game.SCREEN_WIDTH, screen_center_x)
         screen_center_y = max(0, screen_center_y)
-        screen_center_y = min(self.map_height - self.camera.viewport_height, screen_center_y)
+        screen_center_y = min(self.map_height - game.SCREEN_HEIGHT, screen_center_y)
+        return screen_center_x, screen_center_y
 
-        
+    def camera_view(self):
+        """ (left, bottom, right, top) the camera shows once it follows the player, also when headless """
+        left, bottom = self.camera_position()
+        return left, bottom, left + game.SCREEN_WIDTH, bottom + game.SCREEN_HEIGHT
 
-        self.camera.move_to((screen_center_x, screen_center_y))
+    def center_camera_to_player(self):
+        self.camera.move_to(self.camera_position())
 
     def on_update(self, delta_time):
-        """Movement and game logic"""
+        """Advance the simulation in fixed steps to catch up with the frame time"""
+        self.profiler.start()
         if self.display_timer < 0:
 
             self.show_instructions = not self.show_instructions
 
             self.display_timer = 1.0
 
+        self.accumulator += delta_time
+        steps = 0
+        while self.accumulator >= game.FIXED_DELTA_TIME:
+            if steps == game.MAX_SIMULATION_STEPS:
+                # Too far behind, drop the backlog instead of spiralling
+                self.accumulator %= game.FIXED_DELTA_TIME
+                break
+            self.accumulator -= game.FIXED_DELTA_TIME
+            steps += 1
+
+            self.previous_positions = {sprite: sprite.position for sprite in self.moving_sprites()}
+            self.fixed_update(game.FIXED_DELTA_TIME)
+
+            # Stop once the game is over or won
+            if self.outcome is not None:
+                break
+
+        if self.profiler_overlay is not None:
+            self.profiler_overlay.update(delta_time)
+
+    def play_sound(self, sound):
+        """ Play a sound effect, unless running headless """
+        if not self.headless:
+            arcade.play_sound(sound)
+
+    def finish(self, outcome):
+        """ End the run and show the screen for its outcome """
+        self.outcome = outcome
+        self.save_input_recording()
+        if self.headless:
+            return
+        if outcome == "won":
+            win_view = WinView(self)
+            self.window.show_view(win_view)
+        else:
+            game_over_view = GameOverView(self)
+            self.window.show_view(game_over_view)
+            self.play_sound(self.game_over)
+
+    def moving_sprites(self):
+        """ Every sprite whose drawn position is interpolated """
+        for sprite_list in (self.player_list, self.enemy_system.active_list, self.bullet_list,
+                            self.item_list, self.moving_sprites_list):
+            yield from sprite_list
+
+    def interpolate_positions(self):
+        """ Move sprites to where they are between the last two steps, returning their real positions """
+        alpha = self.accumulator / game.FIXED_DELTA_TIME
+        real_positions = {}
+        for sprite, (previous_x, previous_y) in self.previous_positions.items():
+            x, y = sprite.position
+            real_positions[sprite] = (x, y)
+            sprite.position = (previous_x + (x - previous_x) * alpha,
+                               previous_y + (y - previous_y) * alpha)
+        return real_positions
+
+    def fixed_update(self, delta_time):
+        """Movement and game logic for one fixed step"""
+        profiler = self.profiler
+        self.apply_input()
+        self.tick += 1
+
         is_on_ground = self.physics_engine.is_on_ground(self.player_sprite)
         if is_on_ground:
             self.player_sprite.jump_count = 0  # Reset jump count when on the ground
@@ -525,12 +829,18 @@ class GameView(arcade.View):
         
             self.physics_engine.set_friction(self.player_sprite, 1.0)
 
+        profiler.mark("input")
+
         # Move items in the physics engine
-        self.physics_engine.step()
+        self.physics_engine.step(delta_time)
+
+        # Despawn bullets that have flown too long or left the map
+        self.bullet_pool.update(delta_time)
 
         # Clamp the player's position to the map boundaries
         self.player_sprite.center_x = max(0, min(self.player_sprite.center_x, self.map_width))
         self.player_sprite.center_y = max(0, min(self.player_sprite.center_y, self.map_height))
+        profiler.mark("physics")
 
         for moving_sprite in self.moving_sprites_list:
             if moving_sprite.boundary_right and \
@@ -552,40 +862,66 @@ class GameView(arcade.View):
 
             velocity = (moving_sprite.change_x * 1 / delta_time, moving_sprite.change_y * 1 / delta_time)
             self.physics_engine.set_velocity(moving_sprite, velocity)
+        profiler.mark("platforms")
 
-        self.center_camera_to_player()
-        for enemy in self.enemy_list:
-            enemy.update(delta_time, self.player_sprite, self.physics_engine, self.bullet_list)
+        # Bring in the chunks of a streamed level around where the player got to
+        if self.level_streamer is not None:
+            self.level_streamer.update(self.player_sprite.center_x, self.player_sprite.center_y)
+            profiler.mark("streaming")
+
+        self.enemy_system.update(delta_time, self.player_sprite, self.camera_view())
+        profiler.mark("enemies")
+
+        # Pick the textures for where everyone ended up
+        on_ground = [self.physics_engine.is_on_ground(self.player_sprite)] + self.enemy_system.grounded.tolist()
+        self.animation_system.update([self.player_sprite] + self.enemy_system.enemies, on_ground)
+        profiler.mark("animation")
 
         # Check if player reached the goal
         if arcade.check_for_collision_with_list(self.player_sprite, self.goal_list):
-            if self.level == 4:
-                win_view = WinView(self)
-                self.window.show_view(win_view)
+            if self.level == game.LEVEL_COUNT:
+                self.finish("won")
+                return
             else:
                 self.level += 1
                 self.setup()
         
-        # Check for collision with enemies
-        hit_enemies = arcade.check_for_collision_with_list(self.player_sprite, self.enemy_list)
+        # Check for collision with enemies, dormant ones are too far away to touch
+        hit_enemies = arcade.check_for_collision_with_list(self.player_sprite, self.enemy_system.active_list)
         if hit_enemies:
-            game_over_view = GameOverView(self)
-            self.window.show_view(game_over_view)
-            arcade.play_sound(self.game_over)
+            self.finish("game over")
+        profiler.mark("collisions")
         
 
 
     def on_draw(self):
         """ Draw everything """
+        self.profiler.start()
+
+        # Draw sprites part way to their next step, then put them back
+        real_positions = self.interpolate_positions()
+        self.center_camera_to_player()
     
-        self.background_list.draw()
         self.camera.use()
         self.clear()
-        self.wall_list.draw()
-        self.ladder_list.draw()
+
+        # Static layers only draw the chunks around the camera
+        view = visible_rect(self.camera, game.RENDER_MARGIN)
+        self.background_layer.draw(*view)
+        self.wall_layer.draw(*view)
+        self.ladder_layer.draw(*view)
         self.moving_sprites_list.draw()
         self.bullet_list.draw()
         self.item_list.draw()
-        self.goal_list.draw()
+        self.goal_layer.draw(*view)
         self.player_list.draw()
         self.enemy_list.draw()
+
+        for sprite, position in real_positions.items():
+            sprite.position = position
+        self.profiler.mark("draw")
+
+        if self.profiler_overlay is not None:
+            self.gui_camera.use()
+            self.profiler_overlay.draw()
+        self.profiler.end_frame()
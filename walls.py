@@ -0,0 +1,97 @@
+"""Static level collision merged into a few large shapes
+
+Platform tiles never move, so instead of one pymunk body and box per tile
+the level gets a single static body. Runs of tiles with rectangular hit
+boxes are merged into as few rectangles as possible, and any other tile
+keeps its own polygon on that body. The tile sprites are only drawn.
+"""
+import pymunk
+
+# Coordinates closer than this are treated as the same edge
+EDGE_TOLERANCE = 1e-6
+
+
+def collision_type_id(physics_engine, collision_type):
+    """ The pymunk collision type arcade uses for a named collision type, registering it if new """
+    if collision_type not in physics_engine.collision_types:
+        physics_engine.collision_types.append(collision_type)
+    return physics_engine.collision_types.index(collision_type)
+
+
+def _rectangle(points):
+    """ (left, bottom, right, top) if the points outline an axis aligned rectangle, else None """
+    if len(points) != 4:
+        return None
+    xs = sorted({round(x, 6) for x, _ in points})
+    ys = sorted({round(y, 6) for _, y in points})
+    if len(xs) != 2 or len(ys) != 2:
+        return None
+    return xs[0], ys[0], xs[1], ys[1]
+
+
+def _merge(rectangles, along):
+    """ Join rectangles that share a whole edge, side by side for along=0 or stacked for along=1 """
+    across = 1 - along
+    lines = {}
+    for rectangle in rectangles:
+        # Rectangles can only join others with the same extent across the merge direction
+        key = (rectangle[across], rectangle[across + 2])
+        lines.setdefault(key, []).append(rectangle)
+
+    merged = []
+    for line in lines.values():
+        line.sort(key=lambda rectangle: rectangle[along])
+        current = list(line[0])
+        for rectangle in line[1:]:
+            if abs(rectangle[along] - current[along + 2]) < EDGE_TOLERANCE:
+                current[along + 2] = rectangle[along + 2]
+            else:
+                merged.append(tuple(current))
+                current = list(rectangle)
+        merged.append(tuple(current))
+    return merged
+
+
+def merge_hit_boxes(sprite_list):
+    """ Merged rectangles and the leftover polygons covering a layer's hit boxes
+
+    Rectangles are first joined into horizontal runs, then runs with the same
+    left and right edges are stacked, which turns solid blocks of tiles into
+    single rectangles.
+    """
+    rectangles = []
+    polygons = []
+    for sprite in sprite_list:
+        points = sprite.get_adjusted_hit_box()
+        rectangle = _rectangle(points)
+        if rectangle is None:
+            polygons.append(points)
+        else:
+            rectangles.append(rectangle)
+    return _merge(_merge(rectangles, 0), 1), polygons
+
+
+def static_body(physics_engine, walls, friction, collision_type):
+    """ A static pymunk body for (rectangles, polygons) from merge_hit_boxes(), and its shapes, not yet in the space """
+    body = pymunk.Body(body_type=pymunk.Body.STATIC)
+    rectangles, polygons = walls
+    shapes = [pymunk.Poly.create_box_bb(body, pymunk.BB(*rectangle)) for rectangle in rectangles]
+    shapes += [pymunk.Poly(body, points) for points in polygons]
+
+    type_id = collision_type_id(physics_engine, collision_type)
+    for shape in shapes:
+        shape.friction = friction
+        shape.collision_type = type_id
+    return body, shapes
+
+
+def static_walls(physics_engine, sprite_list, friction, collision_type):
+    """ A static pymunk body with merged shapes covering a tile layer, and the shapes, not yet in the space """
+    return static_body(physics_engine, merge_hit_boxes(sprite_list), friction, collision_type)
+
+
+def add_static_walls(physics_engine, walls, friction, collision_type):
+    """ Add a static body for (rectangles, polygons) from merge_hit_boxes() to the space, returning the body """
+    body, shapes = static_body(physics_engine, walls, friction, collision_type)
+    physics_engine.space.add(body, *shapes)
+    return body